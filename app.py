@@ -1,36 +1,38 @@
-from flask import Flask, request, render_template,jsonify
-import ee, math
+from flask import Flask, request, render_template,jsonify, redirect, url_for, Response, stream_with_context, g
+import hmac, json, os, time
 
+from areaindex import IndexedLandcover
+from bulk import analyze_parcels, iter_features, iter_ndjson_features
 
-def carbon_stock_change(t, max_biomass, growth_rate, mortality_rate, root_to_shoot, areas, baseline):
-    # Calculates the change in carbon stocks at year t compared to year t=0
-
-    # Calculate the average carbon stock (tC/ha) in aboveground woody biomass in the project scenario in year t
-    aboveground_woody_biomass = calculate_aboveground_woody_biomass(t, max_biomass, growth_rate, mortality_rate)
-    aboveground_woody_biomass_carbon_stock_avg = aboveground_woody_biomass * 0.47 # Carbon makes up approximately 47% of the dry biomass for most tree species
+from cache import ResultCache
+from jobs import DONE, JobManager, Stage
+from landcover import EarthEngineLandcover, landcover_areas
+from localraster import LocalRasterLandcover
+from metrics import Timings, recording, registry, stage, timed_call
+from projection import aboveground_woody_biomass, converted_area, project_carbon
+from ratelimit import TokenBucket, call_with_retries
+from tiling import TilePlanner
+from timeseries import LANDSAT7_DATASET, LANDSAT7_FIRST_YEAR, ndvi_time_series
 
-    # Calculate the average carbon stock (tC/ha) in woody biomass in the project scenario in year t
-    woody_biomass_carbon_stock_avg = aboveground_woody_biomass_carbon_stock_avg * (1 + root_to_shoot)
+# Use the in-process Earth Engine stand-in when running offline (tests, benchmarks, demos)
+if os.environ.get("BLOCKCARBON_FAKE_EE"):
+    import fake_ee as ee
+else:
+    import ee
 
-    # Calculate the total carbon stocks (tC) of the reforested areas in year t
-    converted_area = areas["Shrubland"] + areas["Grassland"] + areas["Cropland"]
-    total_carbon_stocks = woody_biomass_carbon_stock_avg * converted_area
 
-    # Calculate and return change in carbon stocks
-    change_in_carbon_stocks = total_carbon_stocks - baseline
-    return change_in_carbon_stocks
+def carbon_stock_change(t, max_biomass, growth_rate, mortality_rate, root_to_shoot, areas, baseline):
+    # Calculates the change in carbon stocks at year t compared to year t=0
+    # (scalar wrapper around projection.project_carbon)
+    carbon_stock_changes, _ = project_carbon(t, converted_area(areas), baseline, max_biomass,
+                                             growth_rate, mortality_rate, root_to_shoot, exact=True)
+    return float(carbon_stock_changes[0, 0, 0])
 
 
 def calculate_aboveground_woody_biomass(t, max_biomass, growth_rate, mortality_rate=0.1):
     # Caculates the aboveground woody biomass (t/ha) in the project scenario at year t
-
-    # Logistic growth model to estimate biomass accumulation
-    biomass = max_biomass * (1 - math.exp(-growth_rate * t))
-
-    # Adjust biomass for mortality rate
-    adjusted_biomass = biomass * (1 - mortality_rate)
-
-    return adjusted_biomass
+    # (scalar wrapper around projection.aboveground_woody_biomass)
+    return float(aboveground_woody_biomass(t, max_biomass, growth_rate, mortality_rate, exact=True))
 
 def calculate_baseline(areas):
     # Calculates the baseline carbon stocks (tC) of the area to be converted to tree cover by getting
@@ -60,12 +62,81 @@ def reforest(areas):
     reforested_areas["Cropland"] = 0
     return reforested_areas
 
+def parse_coordinates(data):
+    # Extract the rectangle corners from user input and return (top, bottom, left, right) for GEE
+    top_left_lat = float(data['top_left_latitude'])
+    top_left_lon = float(data['top_left_longitude'])
+    bottom_right_lat = float(data['bottom_right_latitude'])
+    bottom_right_lon = float(data['bottom_right_longitude'])
+
+    top_lat = max(top_left_lat, bottom_right_lat)
+    bottom_lat = min(top_left_lat, bottom_right_lat)
+    left_lon = min(top_left_lon, bottom_right_lon)
+    right_lon = max(top_left_lon, bottom_right_lon)
+    return top_lat, bottom_lat, left_lon, right_lon
+
 app = Flask(__name__)
 
+# NDVI time series settings: years to analyze and the NDVI above which a pixel counts as vegetation
+app.config.setdefault("NDVI_START_YEAR", 2013)
+app.config.setdefault("NDVI_END_YEAR", 2023)
+app.config.setdefault("NDVI_THRESHOLD", 0.2)
+
+# Land cover backend: "earthengine" or "local" (classified tiles in LANDCOVER_TILE_DIR, see localraster.py)
+app.config.setdefault("LANDCOVER_BACKEND", "earthengine")
+app.config.setdefault("LANDCOVER_TILE_DIR", os.path.join(app.instance_path, "landcover_tiles"))
+# Summed-area-table index (see areaindex.py) answering bounding boxes inside the indexed tiles;
+# polygons and other boxes go to the backend above
+app.config.setdefault("LANDCOVER_INDEX_DIR", None)
+
+# Earth Engine reductions over large AOIs are split into tiles of at most TILE_MAX_PIXELS pixels,
+# TILE_CONCURRENCY of them reduced at once and tiles failing with transient errors retried
+# TILE_RETRIES times (bulk requests use their rate limited BULK_RETRIES instead). With
+# ADAPTIVE_SCALE_ERROR (e.g. 0.01) the scale of large AOIs is coarsened while the relative error
+# measured on a pilot tile stays below it.
+app.config.setdefault("TILE_MAX_PIXELS", 5e7)
+app.config.setdefault("TILE_CONCURRENCY", 4)
+app.config.setdefault("TILE_RETRIES", 2)
+app.config.setdefault("ADAPTIVE_SCALE_ERROR", None)
+
+# Result cache settings: SQLite file (empty for memory only), memory LRU size, bounding box grid
+# (degrees) and per-stage time to live overrides (seconds, null for no expiry)
+app.config.setdefault("CACHE_PATH", os.path.join(app.instance_path, "cache.sqlite3"))
+app.config.setdefault("CACHE_MAX_ENTRIES", 1024)
+app.config.setdefault("CACHE_GRID", 1e-4)
+app.config.setdefault("CACHE_TTLS", {})
+
+# Analysis jobs: worker threads shared by all jobs, time limit (s) per job and how long (s)
+# finished jobs stay available
+app.config.setdefault("JOB_WORKERS", 4)
+app.config.setdefault("JOB_TIMEOUT", 120)
+app.config.setdefault("JOB_RETENTION", 3600)
+
+# Bulk analysis: parcels analyzed concurrently per request, Earth Engine requests per second (and
+# burst size) shared by all bulk requests, and retries with exponential backoff on quota errors
+app.config.setdefault("BULK_CONCURRENCY", 4)
+app.config.setdefault("BULK_RATE", 5)
+app.config.setdefault("BULK_BURST", 10)
+app.config.setdefault("BULK_RETRIES", 4)
+app.config.setdefault("BULK_BACKOFF", 1.0)
+
+# Add a Server-Timing header with the stage durations and Earth Engine round trips to analysis responses
+app.config.setdefault("SERVER_TIMING", False)
+
+# Token required by the /admin endpoints; without one they are disabled unless ADMIN_ALLOW_LOCALHOST
+# is set, which trusts requests from localhost (only safe without a reverse proxy on the same host)
+app.config.setdefault("ADMIN_TOKEN", None)
+app.config.setdefault("ADMIN_ALLOW_LOCALHOST", False)
+
+# Settings can be overridden with BLOCKCARBON_<NAME> environment variables (values are parsed as JSON)
+app.config.from_prefixed_env("BLOCKCARBON")
+
 # Set up Earth Engine authentication
+earth_engine_available = True
 try:
     ee.Initialize()
 except ee.EEException as e:
+    earth_engine_available = False
     print("Google Earth Engine initialization error:", e)
 
 # Define land cover classes with their corresponding colors and average carbon stocks per hectare (tC/ha)
@@ -81,134 +152,231 @@ landcover_classes = {
     90: {"name": "Herbaceous Wetland", "color": "#00CED1", "avg_carbon_stocks": 25},       # Dark Turquoise
 }
 
-@app.route('/')
-def index():
-    return render_template('index.html')
-
-@app.route('/submit_coordinates', methods=['POST'])
-def submit_coordinates():
-    data = request.form
-    try:
-        # Extract coordinates from user input
-        top_left_lat = float(data['top_left_latitude'])
-        top_left_lon = float(data['top_left_longitude'])
-        bottom_right_lat = float(data['bottom_right_latitude'])
-        bottom_right_lon = float(data['bottom_right_longitude'])
-
-        # Determine top, bottom, left, and right coordinates for GEE
-        top_lat = max(top_left_lat, bottom_right_lat)
-        bottom_lat = min(top_left_lat, bottom_right_lat)
-        left_lon = min(top_left_lon, bottom_right_lon)
-        right_lon = max(top_left_lon, bottom_right_lon)
-
-        # Create the Rectangle geometry
-        rectangle = ee.Geometry.Rectangle([left_lon, bottom_lat, right_lon, top_lat])
-
-        # Fetch and process the satellite image using GEE
-        s2 = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED') \
+SENTINEL2_DATASET = 'COPERNICUS/S2_SR_HARMONIZED'
+
+# Splits Earth Engine reductions over large AOIs into tiles
+tile_planner = TilePlanner(max_pixels=app.config["TILE_MAX_PIXELS"],
+                           concurrency=app.config["TILE_CONCURRENCY"],
+                           retries=app.config["TILE_RETRIES"],
+                           error_budget=app.config["ADAPTIVE_SCALE_ERROR"])
+
+# Source of the per-class pixel areas
+if app.config["LANDCOVER_BACKEND"] == "local":
+    landcover_source = LocalRasterLandcover(app.config["LANDCOVER_TILE_DIR"])
+elif app.config["LANDCOVER_BACKEND"] == "earthengine":
+    landcover_source = EarthEngineLandcover(ee, tiling=tile_planner)
+else:
+    raise ValueError(f"Unknown LANDCOVER_BACKEND: {app.config['LANDCOVER_BACKEND']}")
+if app.config["LANDCOVER_INDEX_DIR"]:
+    landcover_source = IndexedLandcover(app.config["LANDCOVER_INDEX_DIR"], landcover_source)
+
+# Cache of the Earth Engine results of every analysis stage
+result_cache = ResultCache(app.config["CACHE_PATH"] or None,
+                           max_entries=app.config["CACHE_MAX_ENTRIES"],
+                           grid=app.config["CACHE_GRID"],
+                           ttls=app.config["CACHE_TTLS"])
+
+def satellite_thumbnail_url(bounds):
+    # Thumbnail of the 2021 Sentinel-2 median composite of the rectangle
+    def compute():
+        rectangle = ee.Geometry.Rectangle(list(bounds))
+        s2 = ee.ImageCollection(SENTINEL2_DATASET) \
             .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 30)) \
             .filter(ee.Filter.date('2021-01-01', '2021-12-31')) \
             .filterBounds(rectangle)
-        
+
         # Take a median composite of the image and visualize it
         composite = s2.median().visualize(bands=['B4', 'B3', 'B2'], min=0, max=3000)
-        image_url = composite.getThumbURL({'region': rectangle, 'dimensions': 500})
+        return timed_call("getThumbURL", composite.getThumbURL, {'region': rectangle, 'dimensions': 500})
+
+    return result_cache.get_or_compute("satellite_thumbnail", bounds, [SENTINEL2_DATASET],
+                                       {"year": 2021, "dimensions": 500}, compute)
 
-        # Load and visualize the ESA WorldCover data
-        landcover = ee.Image('ESA/WorldCover/v200/2021')
+def landcover_thumbnail_url(bounds):
+    # Thumbnail of the ESA WorldCover classes in the rectangle
+    palette = [class_info["color"] for class_info in landcover_classes.values()]
+
+    def compute():
+        rectangle = ee.Geometry.Rectangle(list(bounds))
+        landcover = ee.Image(landcover_source.dataset)
         landcoverVis = {
             'min': 10,
             'max': 90,
-            'palette': [class_info["color"] for class_info in landcover_classes.values()]
+            'palette': palette
         }
         landcover_image = landcover.clip(rectangle).visualize(**landcoverVis)
-        landcover_image_url = landcover_image.getThumbURL({'region': rectangle, 'dimensions': 500})
-
-        # Calculate the area for each landcover class
-        areas = {}
-        for class_value, class_info in landcover_classes.items():
-            class_name = class_info["name"]
+        return timed_call("getThumbURL", landcover_image.getThumbURL, {'region': rectangle, 'dimensions': 500})
+
+    return result_cache.get_or_compute("landcover_thumbnail", bounds, [landcover_source.dataset],
+                                       {"palette": palette, "dimensions": 500}, compute)
+
+def cached_landcover_areas(region, call=None, progress=None):
+    # Area (ha) of every landcover class in a rectangle or GeoJSON polygon. `call` performs each
+    # Earth Engine round trip (e.g. with rate limiting and retries) and `progress` receives the
+    # completed fraction. Only rectangles are cached.
+    compute = lambda: landcover_areas(landcover_source, region, landcover_classes, call=call, progress=progress)
+
+    if isinstance(region, dict):
+        return compute()
+    return result_cache.get_or_compute(
+        "landcover_areas", region, [landcover_source.dataset],
+        {"backend": app.config["LANDCOVER_BACKEND"], "scale": landcover_source.scale,
+         "classes": list(landcover_classes), "adaptive_scale_error": app.config["ADAPTIVE_SCALE_ERROR"],
+         "index": bool(app.config["LANDCOVER_INDEX_DIR"])},
+        compute
+    )
+
+def cached_ndvi_time_series(bounds, start_year, end_year, ndvi_threshold, progress=None):
+    # Vegetated area (ha) per year; JSON turns the year keys into strings, so convert them back
+    series = result_cache.get_or_compute(
+        "ndvi_series", bounds, [LANDSAT7_DATASET],
+        {"start_year": start_year, "end_year": end_year, "ndvi_threshold": ndvi_threshold,
+         "adaptive_scale_error": app.config["ADAPTIVE_SCALE_ERROR"]},
+        lambda: ndvi_time_series(ee, bounds, start_year, end_year, ndvi_threshold, tiling=tile_planner,
+                                 progress=progress)
+    )
+    return {int(year): area for year, area in series.items()}
+
+# Runs the stages of every analysis on a bounded thread pool
+job_manager = JobManager(max_workers=app.config["JOB_WORKERS"],
+                         timeout=app.config["JOB_TIMEOUT"],
+                         retention=app.config["JOB_RETENTION"])
+
+# Earth Engine request rate available to bulk analyses
+bulk_limiter = TokenBucket(app.config["BULK_RATE"], app.config["BULK_BURST"])
+
+def carbon_projection(areas):
+    # Carbon stock changes (tC) and carbon credits earned in years 1-10
+    baseline = calculate_baseline(areas)
+    carbon_stock_changes, carbon_credits_earned = project_carbon(
+        range(1, 11), converted_area(areas), baseline, 150, 0.1, 0.1, 0.25)
+    return {
+        "carbon_stock_changes": carbon_stock_changes[0, 0].tolist(),
+        "carbon_credits_earned": carbon_credits_earned[0, 0].tolist(),
+    }
+
+def analysis_stages(bounds, timings=None):
+    # Stages of an AOI analysis. Everything but the carbon projection, which needs the class areas,
+    # is independent and runs concurrently. Stage durations and Earth Engine round trips are
+    # recorded in `timings`. The long stages report progress per tile, which is also where they stop
+    # when the job is cancelled or times out.
+    ndvi_settings = (app.config["NDVI_START_YEAR"], app.config["NDVI_END_YEAR"], app.config["NDVI_THRESHOLD"])
+    if earth_engine_available:
+        satellite_thumbnail = lambda results, progress: satellite_thumbnail_url(bounds)
+        landcover_thumbnail = lambda results, progress: landcover_thumbnail_url(bounds)
+        ndvi_series = lambda results, progress: cached_ndvi_time_series(bounds, *ndvi_settings, progress=progress)
+    else:
+        # Offline only the land cover areas (from local tiles) and the carbon projection can be computed
+        satellite_thumbnail = landcover_thumbnail = lambda results, progress: None
+        ndvi_series = lambda results, progress: {}
+
+    def timed(name, fn):
+        def run(results, progress):
+            progress(0.0)
+            with recording(timings), stage(name, timings):
+                return fn(results, progress)
+        return run
+
+    return [
+        Stage("satellite_thumbnail", timed("satellite_thumbnail", satellite_thumbnail)),
+        Stage("landcover_thumbnail", timed("landcover_thumbnail", landcover_thumbnail)),
+        Stage("landcover_areas", timed("landcover_areas",
+                                       lambda results, progress: cached_landcover_areas(bounds, progress=progress))),
+        Stage("carbon_projection", timed("carbon_projection",
+                                         lambda results, progress: carbon_projection(results["landcover_areas"])),
+              requires=["landcover_areas"]),
+        Stage("ndvi_series", timed("ndvi_series", ndvi_series)),
+    ]
+
+def render_results(coordinates, results):
+    # Renders results.html from the results of the analysis stages
+    top_lat, bottom_lat, left_lon, right_lon = coordinates
+    return render_template('results.html',
+                           image_url=results["satellite_thumbnail"],
+                           landcover_image_url=results["landcover_thumbnail"],
+                           top_lat=top_lat,
+                           left_lon=left_lon,
+                           bottom_lat=bottom_lat,
+                           right_lon=right_lon,
+                           landcover_classes=landcover_classes,
+                           landcover_areas=results["landcover_areas"],
+                           carbon_stock_changes=results["carbon_projection"]["carbon_stock_changes"],
+                           carbon_credits_earned=results["carbon_projection"]["carbon_credits_earned"],
+                           vegetation_series=results["ndvi_series"],
+                           ndvi_threshold=app.config["NDVI_THRESHOLD"]
+                           )
+
+def wants_json():
+    return request.is_json or request.accept_mimetypes.best == 'application/json'
+
+def admin_authorized():
+    # Checks the bearer token of /admin requests
+    token = app.config["ADMIN_TOKEN"]
+    if token:
+        return hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}")
+    return app.config["ADMIN_ALLOW_LOCALHOST"] and request.remote_addr in ("127.0.0.1", "::1")
+
+@registry.collector
+def cache_and_backend_metrics():
+    # Result cache counters and the configured land cover backend, read when /metrics is scraped
+    summary = result_cache.summary()
+    lookups = [({"stage": name, "result": result}, count)
+               for name, counters in summary["stages"].items()
+               for result, count in counters.items()]
+    entries = [({"tier": "memory"}, summary["memory_entries"])]
+    if summary["stored_entries"] is not None:
+        entries.append(({"tier": "disk"}, summary["stored_entries"]))
+    backend = [({"backend": app.config["LANDCOVER_BACKEND"], "dataset": landcover_source.dataset,
+                 "earth_engine": str(earth_engine_available).lower()}, 1)]
+    return [
+        ("blockcarbon_cache_lookups_total", "counter", "Result cache lookups by stage and outcome.", lookups),
+        ("blockcarbon_cache_entries", "gauge", "Entries held by each result cache tier.", entries),
+        ("blockcarbon_landcover_backend_info", "gauge", "Configured land cover backend.", backend),
+    ]
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.timings = None
+    g.timing_total = True
+
+@app.after_request
+def record_request_timing(response):
+    elapsed = time.perf_counter() - g.request_started
+    registry.observe("blockcarbon_http_request_seconds", elapsed,
+                     endpoint=request.endpoint or "unknown", method=request.method)
+    if app.config["SERVER_TIMING"] and g.timings is not None:
+        total = f"total;dur={elapsed * 1000:.1f}" if g.timing_total else None
+        response.headers["Server-Timing"] = ", ".join(filter(None, [g.timings.server_timing(), total]))
+    return response
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
 
-            # Mask the image to isolate the current class
-            masked_class = landcover.eq(class_value)
+@app.route('/')
+def index():
+    return render_template('index.html')
 
-            # Calculate area in square meters
-            area = masked_class.multiply(ee.Image.pixelArea()).reduceRegion(
-                reducer=ee.Reducer.sum(),
-                geometry=rectangle,
-                scale=30,
-                maxPixels=1e9
-            ).getInfo()
+@app.route('/submit_coordinates', methods=['POST'])
+def submit_coordinates():
+    data = request.form
+    try:
+        # Extract coordinates from user input
+        top_lat, bottom_lat, left_lon, right_lon = parse_coordinates(data)
 
-            # Convert the area to hectares (1 hectare = 10,000 m²)
-            areas[class_name] = area['Map'] / 10000 if area['Map'] else 0
+        # Snap the rectangle to the cache grid so repeated queries reuse earlier results
+        bounds = result_cache.snap((left_lon, bottom_lat, right_lon, top_lat))
 
-        baseline = calculate_baseline(areas)
+        # Run the analysis stages concurrently and wait for all of them
+        g.timings = Timings()
+        job = job_manager.submit(analysis_stages(bounds, g.timings))
+        job.wait()
+        if job.status != DONE:
+            raise Exception(job.error)
 
-        # Calculate carbon stock changes (tC) in years 1-10
-        carbon_stock_changes = []
-        for year in range(1, 11):
-            carbon_stock_changes.append(carbon_stock_change(year, 150, 0.1, 0.1, 0.25, areas, baseline))
-        
-        # Calculate carbon credits earned in years 1-10
-        carbon_credits_earned = []
-        for year in range(10):
-            carbon_credits_earned.append(carbon_stock_changes[year] * (44/12))
-
-         ### BEGIN TIME SERIES ANALYSIS ###
-
-        # Import image collection for each year from Landsat data
-        areas_collection = {}
-        for year in range(2013, 2024):
-            landsat7 = ee.ImageCollection("LANDSAT/LE07/C02/T1_L2") \
-                .filter(ee.Filter.date(ee.Date.fromYMD(year, 1, 1), ee.Date.fromYMD(year, 12, 31))) \
-                .filter(ee.Filter.lt('CLOUD_COVER', 20)) \
-                .filterBounds(rectangle)
-            
-            # Function to calculate NDVI
-            def calculate_ndvi(image):
-                ndvi = image.normalizedDifference(['SR_B4', 'SR_B3']).rename('NDVI')  # NIR (B4), Red (B3)
-                return image.addBands(ndvi)
-
-            # Apply NDVI calculation to the image collection
-            landsat7_ndvi = landsat7.map(calculate_ndvi)
-
-            # Take a median composite to reduce noise
-            median_landsat7 = landsat7_ndvi.select('NDVI').median().clip(rectangle)
-
-            # Threshold NDVI to classify vegetation (e.g., NDVI > 0.3)
-            vegetation_mask = median_landsat7.gt(0.2)
-
-            # Calculate the area of vegetation
-            # Pixel area in square meters
-            pixel_area = median_landsat7.pixelArea().divide(10000)
-
-            # Mask areas that are classified as vegetation
-            vegetation_area = pixel_area.updateMask(vegetation_mask)
-
-            # Calculate the total vegetation area in the ROI
-            vegetation_area_sum = vegetation_area.reduceRegion(
-                reducer=ee.Reducer.sum(),
-                geometry=rectangle,
-                scale=30,
-                maxPixels=1e9
-            )
-
-            # Print the total vegetation area (in square meters)
-            print(f"Year: {year}", "Vegetation Area (sq meters):", vegetation_area_sum.getInfo())
-
-        return render_template('results.html',
-                               image_url=image_url,
-                               landcover_image_url=landcover_image_url,
-                               top_lat=top_lat,
-                               left_lon=left_lon,
-                               bottom_lat=bottom_lat,
-                               right_lon=right_lon,
-                               landcover_classes=landcover_classes,
-                               landcover_areas=areas,
-                               carbon_stock_changes=carbon_stock_changes,
-                               carbon_credits_earned=carbon_credits_earned
-                               )
+        with stage("render", g.timings):
+            return render_results((top_lat, bottom_lat, left_lon, right_lon), job.results)
     except Exception as e:
         # print("Error processing coordinates:", e)
         # return render_template('error.html', error_message='An error occurred while processing the coordinates.')
@@ -217,5 +385,147 @@ def submit_coordinates():
         print("Full traceback:", traceback.format_exc())
         return render_template('error.html', error_message=str(e))
 
+@app.route('/ndvi_time_series', methods=['POST'])
+def ndvi_time_series_json():
+    # Returns the vegetated area (ha) per year as JSON. The year range and NDVI threshold default to
+    # the app config and can be overridden per request; years must lie within the Landsat 7 record.
+    if not earth_engine_available:
+        return jsonify({"error": "Google Earth Engine is not available"}), 503
+    data = request.get_json(silent=True)
+    if data is None:
+        data = request.form
+    try:
+        top_lat, bottom_lat, left_lon, right_lon = parse_coordinates(data)
+        start_year = int(data.get('start_year', app.config["NDVI_START_YEAR"]))
+        end_year = int(data.get('end_year', app.config["NDVI_END_YEAR"]))
+        ndvi_threshold = float(data.get('ndvi_threshold', app.config["NDVI_THRESHOLD"]))
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid request: {e}"}), 400
+    if start_year > end_year:
+        return jsonify({"error": "start_year must not be after end_year"}), 400
+    last_year = time.gmtime().tm_year
+    if start_year < LANDSAT7_FIRST_YEAR or end_year > last_year:
+        return jsonify({"error": f"Years must be between {LANDSAT7_FIRST_YEAR} and {last_year}"}), 400
+
+    try:
+        bounds = result_cache.snap((left_lon, bottom_lat, right_lon, top_lat))
+        series = cached_ndvi_time_series(bounds, start_year, end_year, ndvi_threshold)
+    except Exception as e:
+        print("Error processing NDVI time series:", str(e))
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({
+        "bounds": {"top_lat": top_lat, "left_lon": left_lon, "bottom_lat": bottom_lat, "right_lon": right_lon},
+        "ndvi_threshold": ndvi_threshold,
+        "vegetated_ha": {str(year): area for year, area in series.items()}
+    })
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    # Validates the coordinates and starts the analysis in the background. JSON clients get the job
+    # ID (202), browsers are redirected to a page that polls the job and then shows the results.
+    data = request.get_json(silent=True)
+    if data is None:
+        data = request.form
+    try:
+        coordinates = parse_coordinates(data)
+    except (KeyError, TypeError, ValueError) as e:
+        if wants_json():
+            return jsonify({"error": f"Invalid coordinates: {e}"}), 400
+        return render_template('error.html', error_message=f"Invalid coordinates: {e}"), 400
+
+    top_lat, bottom_lat, left_lon, right_lon = coordinates
+    bounds = result_cache.snap((left_lon, bottom_lat, right_lon, top_lat))
+    timings = Timings()
+    job = job_manager.submit(analysis_stages(bounds, timings), context={"coordinates": coordinates, "timings": timings})
+
+    if wants_json():
+        status_url = url_for('job_status', job_id=job.id)
+        return jsonify({"job_id": job.id, "status_url": status_url,
+                        "results_url": url_for('job_results', job_id=job.id)}), 202, {"Location": status_url}
+    return redirect(url_for('job_page', job_id=job.id), 303)
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    # Progress of every stage and the results available so far
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(dict(job.to_dict(), timings=job.context["timings"].to_dict()))
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/view')
+def job_page(job_id):
+    if job_manager.get(job_id) is None:
+        return render_template('error.html', error_message='Unknown or expired analysis job.'), 404
+    return render_template('job.html', job_id=job_id)
+
+@app.route('/jobs/<job_id>/results')
+def job_results(job_id):
+    # Renders results.html once the job has finished
+    job = job_manager.get(job_id)
+    if job is None:
+        return render_template('error.html', error_message='Unknown or expired analysis job.'), 404
+    if not job.finished:
+        return redirect(url_for('job_page', job_id=job_id))
+    if job.status != DONE:
+        return render_template('error.html', error_message=job.error)
+    # The job's stages plus this request's render time, leaving the job's own timings untouched. The
+    # request total is left out as it would sit next to stage times measured in the background.
+    g.timings = job.context["timings"].copy()
+    g.timing_total = False
+    if job.started_at is not None:
+        g.timings.add("job", job.finished_at - job.started_at)
+    with stage("render", g.timings):
+        return render_results(job.context["coordinates"], job.results)
+
+@app.route('/bulk', methods=['POST'])
+def bulk_analysis():
+    # Analyzes every parcel of a GeoJSON FeatureCollection (or of newline-delimited GeoJSON features)
+    # and streams one NDJSON record per parcel as soon as that parcel is finished
+    if request.mimetype in ('application/x-ndjson', 'application/geo+json-seq'):
+        features = iter_ndjson_features(request.stream)
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "Expected a GeoJSON FeatureCollection"}), 400
+        features = iter_features(data)
+
+    def earth_engine_call(fn):
+        return call_with_retries(fn, limiter=bulk_limiter,
+                                 retries=app.config["BULK_RETRIES"],
+                                 backoff=app.config["BULK_BACKOFF"])
+
+    def analyze(region):
+        if not isinstance(region, dict):
+            region = result_cache.snap(region)
+        areas = cached_landcover_areas(region, call=earth_engine_call)
+        return {"landcover_areas": areas, "baseline": calculate_baseline(areas), **carbon_projection(areas)}
+
+    records = analyze_parcels(features, analyze, app.config["BULK_CONCURRENCY"])
+    return Response(stream_with_context(json.dumps(record) + "\n" for record in records),
+                    mimetype='application/x-ndjson')
+
+@app.route('/admin/cache', methods=['GET'])
+def cache_stats():
+    # Hit/miss counters and sizes of the result cache
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify(result_cache.summary())
+
+@app.route('/admin/cache', methods=['DELETE'])
+def invalidate_cache():
+    # Removes cached results: everything, one stage (?stage=landcover_areas) or one key (?key=...)
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    removed = result_cache.invalidate(stage=request.args.get('stage'), key=request.args.get('key'))
+    return jsonify({"removed": removed})
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,282 @@
+# Summed-area-table index of land cover class areas.
+#
+# For every classified tile (see localraster.py) the index stores the cumulative per-class pixel
+# area of square blocks of pixels (a summed-area table / integral image) as a memory-mappable .npy
+# array. The class areas of any box of whole blocks are then four lookups per class; only the partial
+# blocks along the edges of the box are counted from the raster, so smaller blocks mean faster
+# queries and larger tables. Every tile gets the smallest of the candidate block sizes whose table
+# stays under MAX_TABLE_CELLS. Results match LocalRasterLandcover (pixels are assigned by their
+# centres in both) up to rounding.
+#
+# Build or extend an index (tiles already indexed and unchanged are skipped):
+#
+#   python areaindex.py TILE_DIR INDEX_DIR --levels 16 64 256 --bounds LEFT BOTTOM RIGHT TOP
+
+import argparse, json, os, uuid
+
+import numpy as np
+
+from landcover import region_bounds
+from localraster import STRIP_ROWS, RasterTile, load_tiles, row_pixel_areas, window_class_areas
+
+MANIFEST = "index.json"
+DEFAULT_LEVELS = (16, 64, 256)    # Candidate block sizes (pixels), finest first
+MAX_TABLE_CELLS = 5e7             # Largest table built unless no candidate block size fits
+
+
+def tile_classes(tile, nodata=0):
+    # Class values present in a tile
+    counts = np.zeros(256, dtype=np.int64)
+    rows, cols = tile.shape
+    for strip_start in range(0, rows, STRIP_ROWS):
+        classes = np.asarray(tile.read(strip_start, min(strip_start + STRIP_ROWS, rows), 0, cols))
+        counts += np.bincount(classes.astype(np.int64).ravel(), minlength=256)
+    counts[nodata] = 0
+    return np.flatnonzero(counts)
+
+
+def build_table(tile, classes, block, path):
+    # Writes the (classes, block rows + 1, block cols + 1) summed-area table of the per-class block
+    # areas of `tile` to `path`, one strip of blocks at a time
+    rows, cols = tile.shape
+    block_rows, block_cols = -(-rows // block), -(-cols // block)
+    dx, dy = tile.pixel_size
+    table = np.lib.format.open_memmap(path, mode="w+", dtype=np.float64,
+                                      shape=(len(classes), block_rows + 1, block_cols + 1))
+    table[:] = 0
+
+    lookup = np.full(256, -1, dtype=np.int64)
+    lookup[classes] = np.arange(len(classes))
+    column_blocks = np.arange(cols) // block
+    strip_rows = max(STRIP_ROWS // block, 1) * block
+    for strip_start in range(0, rows, strip_rows):
+        strip_stop = min(strip_start + strip_rows, rows)
+        index = lookup[np.asarray(tile.read(strip_start, strip_stop, 0, cols)).astype(np.int64)]
+        row_areas = row_pixel_areas(tile.bounds[3] - strip_start * dy, dy, dx, strip_stop - strip_start)
+        strip_blocks = -(-(strip_stop - strip_start) // block)
+
+        # Sum the pixel areas per (block row, block column, class) with one weighted bincount
+        row_blocks = np.arange(strip_stop - strip_start) // block
+        keys = index + len(classes) * (column_blocks + block_cols * row_blocks[:, None])
+        valid = index >= 0
+        weights = np.broadcast_to(row_areas[:, None], index.shape)[valid]
+        sums = np.bincount(keys[valid], weights=weights, minlength=len(classes) * block_cols * strip_blocks)
+        sums = sums.reshape(strip_blocks, block_cols, len(classes)).transpose(2, 0, 1)
+
+        # Accumulate along columns and rows, continuing from the last row of the previous strip
+        first = strip_start // block
+        above = np.array(table[:, first, 1:])
+        table[:, first + 1:first + 1 + strip_blocks, 1:] = sums.cumsum(axis=2).cumsum(axis=1) + above[:, None, :]
+    table.flush()
+    return table
+
+
+class IndexedTile:
+    # A raster tile with the summed-area table (.npy path) of its `block` sized blocks
+    def __init__(self, tile, classes, table_path, block, nodata=0):
+        self.tile = tile
+        self.classes = np.asarray(classes, dtype=np.int64)
+        self.table_path = table_path
+        self.block = block
+        self.nodata = nodata
+        self._table = None
+
+    def table(self):
+        if self._table is None:
+            self._table = np.load(self.table_path, mmap_mode="r")
+        return self._table
+
+    def class_areas(self, bounds):
+        # Per-class area (m²) inside `bounds`: whole blocks from the table, the partial blocks along
+        # the edges from the raster
+        tile = self.tile
+        row_start, row_stop, col_start, col_stop = tile.window(bounds)
+        totals = np.zeros(256)
+        if row_start >= row_stop or col_start >= col_stop:
+            return totals
+
+        block = self.block
+        table = self.table()
+        rows, cols = tile.shape
+        first_row, first_col = -(-row_start // block), -(-col_start // block)
+        # The last block of the tile may be partial; it is whole as far as the box is concerned
+        # when the box reaches the tile edge
+        last_row = table.shape[1] - 1 if row_stop == rows else row_stop // block
+        last_col = table.shape[2] - 1 if col_stop == cols else col_stop // block
+        if first_row >= last_row or first_col >= last_col:
+            totals = window_class_areas(tile, row_start, row_stop, col_start, col_stop)
+            totals[self.nodata] = 0
+            return totals
+
+        inner = (table[:, last_row, last_col] - table[:, first_row, last_col]
+                 - table[:, last_row, first_col] + table[:, first_row, first_col])
+        # Classes absent from the box leave rounding residue, far below the area of one pixel
+        inner[np.abs(inner) <= 16 * np.finfo(float).eps * table[:, -1, -1]] = 0
+        totals[self.classes] = inner
+
+        top, bottom = first_row * block, min(last_row * block, rows)
+        left, right = first_col * block, min(last_col * block, cols)
+        for window in ((row_start, top, col_start, col_stop), (bottom, row_stop, col_start, col_stop),
+                       (top, bottom, col_start, left), (top, bottom, right, col_stop)):
+            totals += window_class_areas(tile, *window)
+        totals[self.nodata] = 0
+        return totals
+
+
+def _read_manifest(index_dir):
+    path = os.path.join(index_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {"tiles": []}
+    with open(path) as f:
+        return json.load(f)
+
+
+def build_index(tile_dir, index_dir, levels=DEFAULT_LEVELS, bounds=None, nodata=0, max_cells=MAX_TABLE_CELLS):
+    # Indexes the tiles of `tile_dir` (only those intersecting `bounds`, when given) into `index_dir`.
+    # Tiles already indexed with the same levels whose source file is unchanged are skipped, so the
+    # index can be extended region by region. Returns the paths of the tiles (re)indexed.
+    #
+    # Tables are written under new names and only the manifest swap makes them visible, so readers
+    # of the previous manifest keep finding the tables (and class lists) that belong together.
+    # Superseded tables are removed afterwards.
+    os.makedirs(index_dir, exist_ok=True)
+    previous = _read_manifest(index_dir)["tiles"]
+    entries = {os.path.abspath(os.path.join(index_dir, entry["source"])): entry for entry in previous}
+    levels = sorted(set(int(level) for level in levels))
+
+    built = []
+    for tile in load_tiles(tile_dir):
+        if bounds is not None and not tile.intersects(bounds):
+            continue
+        source = os.path.abspath(tile.path)
+        stat = os.stat(source)
+        entry = entries.get(source)
+        if entry is not None and "table" in entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size \
+                and entry["levels"] == levels and entry["nodata"] == nodata:
+            continue
+
+        # The finest block size whose table fits, or else the coarsest
+        classes = tile_classes(tile, nodata)
+        rows, cols = tile.shape
+        block = next((level for level in levels
+                      if len(classes) * (-(-rows // level) + 1) * (-(-cols // level) + 1) <= max_cells), levels[-1])
+        name = os.path.splitext(os.path.relpath(source, tile_dir))[0].replace(os.sep, "_")
+        table = f"{name}.b{block}.{uuid.uuid4().hex[:12]}.npy"
+        build_table(tile, classes, block, os.path.join(index_dir, table))
+
+        entries[source] = {
+            "source": os.path.relpath(source, index_dir),
+            "bounds": list(tile.bounds),
+            "shape": list(tile.shape),
+            "dtype": str(tile.dtype),
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "nodata": nodata,
+            "levels": levels,
+            "classes": classes.tolist(),
+            "block": block,
+            "table": table,
+        }
+        built.append(source)
+
+    # Write the manifest last (atomically), so readers never see tables that are still being built
+    manifest_path = os.path.join(index_dir, MANIFEST)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump({"tiles": list(entries.values())}, f, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    current = {entry["table"] for entry in entries.values()}
+    for entry in previous:
+        if entry.get("table") and entry["table"] not in current:
+            try:
+                os.remove(os.path.join(index_dir, entry["table"]))
+            except FileNotFoundError:
+                pass
+    return built
+
+
+class AreaIndex:
+    # Read side of an index directory. The manifest is reloaded when an incremental build replaces it.
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self.tiles = []
+        self._manifest_mtime = None
+        self.refresh()
+
+    def refresh(self):
+        path = os.path.join(self.index_dir, MANIFEST)
+        mtime = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+        if mtime == self._manifest_mtime:
+            return
+        tiles = []
+        for entry in _read_manifest(self.index_dir)["tiles"]:
+            tile = RasterTile(os.path.join(self.index_dir, entry["source"]), entry["bounds"], entry["shape"],
+                              entry["dtype"])
+            tiles.append(IndexedTile(tile, entry["classes"], os.path.join(self.index_dir, entry["table"]),
+                                     entry["block"], entry["nodata"]))
+        self.tiles = tiles
+        self._manifest_mtime = mtime
+
+    def covers(self, bounds):
+        # Whether the indexed tiles (which do not overlap) cover the whole box
+        left, bottom, right, top = bounds
+        covered = 0.0
+        for indexed in self.tiles:
+            tile_left, tile_bottom, tile_right, tile_top = indexed.tile.bounds
+            width = min(right, tile_right) - max(left, tile_left)
+            height = min(top, tile_top) - max(bottom, tile_bottom)
+            if width > 0 and height > 0:
+                covered += width * height
+        return covered >= (right - left) * (top - bottom) * (1 - 1e-9)
+
+    def class_pixel_areas(self, bounds):
+        try:
+            return self._class_pixel_areas(bounds)
+        except FileNotFoundError:
+            # A rebuild removed a table this reader had not loaded yet; switch to the new manifest
+            self.refresh()
+            return self._class_pixel_areas(bounds)
+
+    def _class_pixel_areas(self, bounds):
+        totals = np.zeros(256)
+        for indexed in self.tiles:
+            if indexed.tile.intersects(bounds):
+                totals += indexed.class_areas(bounds)
+        return {class_value: float(total) for class_value, total in enumerate(totals) if total > 0}
+
+
+class IndexedLandcover:
+    # Land cover source answering bounding boxes covered by the index in `index_dir` and passing
+    # everything else (polygons, boxes outside the indexed regions) to `fallback`
+    def __init__(self, index_dir, fallback):
+        self.index = AreaIndex(index_dir)
+        self.fallback = fallback
+        self.dataset = fallback.dataset
+        self.scale = fallback.scale
+
+    def class_pixel_areas(self, region, call=None, progress=None):
+        if not isinstance(region, dict):
+            self.index.refresh()
+            bounds = region_bounds(region)
+            if self.index.covers(bounds):
+                return self.index.class_pixel_areas(bounds)
+        return self.fallback.class_pixel_areas(region, call=call, progress=progress)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or extend a land cover summed-area-table index")
+    parser.add_argument("tile_dir", help="directory of classified tiles (see localraster.py)")
+    parser.add_argument("index_dir")
+    parser.add_argument("--levels", type=int, nargs="+", default=list(DEFAULT_LEVELS),
+                        help="candidate block sizes (pixels); each tile gets the finest whose table fits")
+    parser.add_argument("--bounds", type=float, nargs=4, metavar=("LEFT", "BOTTOM", "RIGHT", "TOP"),
+                        help="only index the tiles intersecting this box")
+    parser.add_argument("--nodata", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    built = build_index(args.tile_dir, args.index_dir, args.levels, args.bounds, args.nodata)
+    print(f"Indexed {len(built)} tile(s) into {args.index_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+# Offline benchmark of the /submit_coordinates request path.
+#
+# Runs the Flask app against the in-process Earth Engine stand-in (fake_ee) with injected round trip
+# latency and reports p50/p95 wall time per stage, read back from the Server-Timing header.
+# With --landcover-index it instead compares land cover box queries answered by the summed-area-table
+# index (areaindex.py) with full recomputation from the raster, on a synthetic tile.
+#
+#   python benchmark.py --iterations 20 --latency 0.3 --jitter 0.1
+#   python benchmark.py --warm --json
+#   python benchmark.py --landcover-index --iterations 200 --pixels 6000
+
+import argparse, json, os, random, sys, tempfile, time
+
+import numpy as np
+
+# Configure the app before importing it: fake Earth Engine, memory-only cache, Server-Timing on
+os.environ["BLOCKCARBON_FAKE_EE"] = "1"
+os.environ["BLOCKCARBON_CACHE_PATH"] = '""'
+os.environ["BLOCKCARBON_SERVER_TIMING"] = "true"
+
+import app as blockcarbon
+import fake_ee
+from areaindex import DEFAULT_LEVELS, IndexedLandcover, build_index
+from localraster import LocalRasterLandcover, save_tile
+
+
+def parse_server_timing(header):
+    # {name: milliseconds} from a Server-Timing header
+    timings = {}
+    for entry in filter(None, (part.strip() for part in header.split(","))):
+        name, *params = entry.split(";")
+        for param in params:
+            if param.startswith("dur="):
+                timings[name] = float(param[4:])
+    return timings
+
+
+def random_aoi(rng, size):
+    # A `size` degree square somewhere in the tropics
+    top = rng.uniform(-20, 20)
+    left = rng.uniform(-80, 120)
+    return {
+        "top_left_latitude": top,
+        "top_left_longitude": left,
+        "bottom_right_latitude": top - size,
+        "bottom_right_longitude": left + size,
+    }
+
+
+def percentiles(values):
+    values = np.asarray(values)
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "mean_ms": float(values.mean()),
+        "samples": len(values),
+    }
+
+
+def synthetic_landcover(rng, pixels):
+    # A square WorldCover style class array: patches of ~50 pixels with 5% speckle
+    patches = rng.choice([10, 20, 30, 40, 50, 60, 80, 90], size=(pixels // 50 + 1, pixels // 50 + 1))
+    classes = np.repeat(np.repeat(patches, 50, axis=0), 50, axis=1)[:pixels, :pixels]
+    speckle = rng.random((pixels, pixels)) < 0.05
+    classes[speckle] = rng.choice([10, 30, 60], size=int(speckle.sum()))
+    return classes.astype(np.uint8)
+
+
+def run_index(iterations=200, pixels=4000, levels=DEFAULT_LEVELS, seed=0):
+    # Latency of nudged bounding box queries: full recomputation from the tile vs the index
+    rng = np.random.default_rng(seed)
+    pixel_size = 1 / 12000                       # ESA WorldCover resolution (degrees)
+    extent = pixels * pixel_size
+    left, bottom = 10.0, -1.0
+    with tempfile.TemporaryDirectory() as directory:
+        tile_dir, index_dir = os.path.join(directory, "tiles"), os.path.join(directory, "index")
+        save_tile(tile_dir, "synthetic", synthetic_landcover(rng, pixels), (left, bottom, left + extent, bottom + extent))
+        start = time.perf_counter()
+        build_index(tile_dir, index_dir, levels)
+        build_seconds = time.perf_counter() - start
+
+        local = LocalRasterLandcover(tile_dir)
+        indexed = IndexedLandcover(index_dir, local)
+
+        # Start from a box covering a quarter of the tile and nudge it like a user exploring the map
+        width = height = extent / 2
+        x, y = left + extent / 4, bottom + extent / 4
+        recompute, lookup, worst = [], [], 0.0
+        for _ in range(iterations):
+            x = float(np.clip(x + rng.normal(0, extent / 50), left, left + extent - width))
+            y = float(np.clip(y + rng.normal(0, extent / 50), bottom, bottom + extent - height))
+            box = (x, y, x + width, y + height)
+
+            start = time.perf_counter()
+            expected = local.class_pixel_areas(box)
+            recompute.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            areas = indexed.class_pixel_areas(box)
+            lookup.append((time.perf_counter() - start) * 1000)
+            worst = max([worst] + [abs(areas.get(key, 0) - value) / value for key, value in expected.items()])
+
+    return {
+        "iterations": iterations,
+        "tile_pixels": pixels,
+        "levels": list(levels),
+        "build_s": build_seconds,
+        "max_relative_difference": worst,
+        "queries": {"recompute": percentiles(recompute), "index": percentiles(lookup)},
+    }
+
+
+def run(iterations=20, latency=0.2, jitter=0.05, size=0.05, warm=False, seed=0):
+    rng = random.Random(seed)
+    latency_rng = random.Random(seed + 1)
+    fake_ee.reset()
+    fake_ee.configure(latency=lambda kind: max(0.0, latency_rng.gauss(latency, jitter)))
+    client = blockcarbon.app.test_client()
+
+    aoi = random_aoi(rng, size)
+    if warm:
+        client.post('/submit_coordinates', data=aoi)
+
+    samples = {}
+    calls_per_request = []
+    for _ in range(iterations):
+        if not warm:
+            blockcarbon.result_cache.invalidate()
+            aoi = random_aoi(rng, size)
+        calls_before = sum(fake_ee.calls.values())
+        response = client.post('/submit_coordinates', data=aoi)
+        if response.status_code != 200 or "Server-Timing" not in response.headers:
+            raise RuntimeError(f"Request failed with status {response.status_code}")
+        calls_per_request.append(sum(fake_ee.calls.values()) - calls_before)
+        for name, milliseconds in parse_server_timing(response.headers["Server-Timing"]).items():
+            samples.setdefault(name, []).append(milliseconds)
+
+    stages = {name: percentiles(values) for name, values in samples.items()}
+    return {
+        "iterations": iterations,
+        "latency_s": latency,
+        "jitter_s": jitter,
+        "aoi_size_deg": size,
+        "warm_cache": warm,
+        "earth_engine_calls_per_request": float(np.mean(calls_per_request)),
+        "stages": stages,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of /submit_coordinates")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="mean Earth Engine round trip latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.05, help="standard deviation of the latency (s)")
+    parser.add_argument("--size", type=float, default=0.05, help="AOI edge length (degrees)")
+    parser.add_argument("--warm", action="store_true", help="repeat one AOI with a warm result cache")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--landcover-index", action="store_true",
+                        help="benchmark the land cover index against full recomputation instead")
+    parser.add_argument("--pixels", type=int, default=4000, help="edge length of the synthetic tile (--landcover-index)")
+    parser.add_argument("--levels", type=int, nargs="+", default=list(DEFAULT_LEVELS),
+                        help="candidate index block sizes (--landcover-index)")
+    args = parser.parse_args(argv)
+
+    if args.landcover_index:
+        report = run_index(args.iterations, args.pixels, args.levels, args.seed)
+    else:
+        report = run(args.iterations, args.latency, args.jitter, args.size, args.warm, args.seed)
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+
+    if args.landcover_index:
+        print(f"{report['iterations']} box queries on a {report['tile_pixels']}² pixel tile, "
+              f"index (block sizes {report['levels']}) built in {report['build_s']:.2f}s, "
+              f"max relative difference {report['max_relative_difference']:.1e}")
+        print(f"{'method':<24}{'p50 (ms)':>12}{'p95 (ms)':>12}{'mean (ms)':>12}")
+        for name, stats in report["queries"].items():
+            print(f"{name:<24}{stats['p50_ms']:>12.2f}{stats['p95_ms']:>12.2f}{stats['mean_ms']:>12.2f}")
+        return
+
+    print(f"{report['iterations']} requests, {report['latency_s']}s ± {report['jitter_s']}s latency, "
+          f"{'warm' if report['warm_cache'] else 'cold'} cache, "
+          f"{report['earth_engine_calls_per_request']:.1f} Earth Engine calls per request")
+    print(f"{'stage':<24}{'p50 (ms)':>12}{'p95 (ms)':>12}{'mean (ms)':>12}")
+    for name, stats in report["stages"].items():
+        print(f"{name:<24}{stats['p50_ms']:>12.1f}{stats['p95_ms']:>12.1f}{stats['mean_ms']:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# Bulk multi-parcel analysis.
+#
+# Parcels come from a GeoJSON FeatureCollection (or one GeoJSON Feature per line) and are analyzed
+# on a bounded thread pool. One record per parcel is yielded as soon as that parcel is finished, so
+# neither the results nor the pending work grow with the number of parcels. A parcel that fails is
+# reported in its record instead of aborting the batch.
+#
+# Only newline-delimited input is also read incrementally; a FeatureCollection is parsed as a whole
+# before the first parcel starts, so its memory use grows with the size of the document.
+
+import json
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+def iter_features(data):
+    # Yields the features of a FeatureCollection, a single Feature or a bare geometry
+    if data.get("type") == "FeatureCollection":
+        yield from data.get("features") or []
+    elif data.get("type") == "Feature":
+        yield data
+    else:
+        yield {"type": "Feature", "geometry": data, "properties": {}}
+
+
+def iter_ndjson_features(lines):
+    # Yields one feature per non-empty line of newline-delimited GeoJSON. Lines that are not valid
+    # JSON are passed on as errors so they show up in the output.
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f"Invalid JSON: {e}")
+
+
+def parcel_region(feature):
+    # Region of a parcel: its Polygon / MultiPolygon geometry or, for rectangles without a geometry,
+    # its GeoJSON `bbox` as (left, bottom, right, top)
+    if isinstance(feature, Exception):
+        raise feature
+    if not isinstance(feature, dict):
+        raise ValueError("Parcel is not a GeoJSON feature")
+    geometry = feature.get("geometry")
+    if geometry is None:
+        bbox = feature.get("bbox")
+        if bbox is None or len(bbox) != 4:
+            raise ValueError("Parcel has neither a geometry nor a bbox")
+        left, bottom, right, top = [float(value) for value in bbox]
+        if left >= right or bottom >= top:
+            raise ValueError("Parcel bbox is empty")
+        return left, bottom, right, top
+    if geometry.get("type") not in ("Polygon", "MultiPolygon"):
+        raise ValueError(f"Unsupported geometry type: {geometry.get('type')}")
+    if not geometry.get("coordinates"):
+        raise ValueError("Parcel geometry has no coordinates")
+    return {"type": geometry["type"], "coordinates": geometry["coordinates"]}
+
+
+def parcel_id(feature, index):
+    if isinstance(feature, dict):
+        if feature.get("id") is not None:
+            return feature["id"]
+        properties = feature.get("properties") or {}
+        if properties.get("id") is not None:
+            return properties["id"]
+    return index
+
+
+def analyze_parcels(features, analyze, concurrency=4):
+    # Runs `analyze(region)` for every feature with at most `concurrency` parcels in flight and yields
+    # {"index", "id", ...result} or {"index", "id", "error"} records in completion order
+    def run(index, feature):
+        record = {"index": index, "id": parcel_id(feature, index)}
+        try:
+            record.update(analyze(parcel_region(feature)))
+        except Exception as e:
+            record["error"] = str(e)
+        return record
+
+    features = enumerate(features)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bulk") as executor:
+        pending = set()
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < concurrency:
+                try:
+                    index, feature = next(features)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.add(executor.submit(run, index, feature))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
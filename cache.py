@@ -0,0 +1,162 @@
+# Two-tier result cache for AOI analyses.
+#
+# Results are kept in an in-memory LRU in front of an SQLite store, so they survive restarts and are
+# shared between worker processes. Keys combine the stage name, the bounding box snapped to a grid,
+# the dataset IDs and the stage parameters. Every stage has its own time to live: thumbnail URLs
+# expire on the Earth Engine side, area statistics do not.
+
+import collections, hashlib, json, os, sqlite3, threading, time
+
+# Default time to live (seconds) per stage; None keeps entries until they are invalidated
+DEFAULT_TTLS = {
+    "satellite_thumbnail": 3600,
+    "landcover_thumbnail": 3600,
+    "landcover_areas": None,
+    "ndvi_series": None,
+}
+
+
+class ResultCache:
+    def __init__(self, path=None, max_entries=1024, grid=1e-4, ttls=None):
+        # `path` is the SQLite file (None keeps the cache in memory only), `grid` the size (degrees)
+        # of the grid bounding boxes are snapped to and `max_entries` the size of the memory tier
+        self.path = path
+        self.max_entries = max_entries
+        self.grid = grid
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.stats = collections.defaultdict(lambda: {"memory_hits": 0, "disk_hits": 0, "misses": 0})
+        self._memory = collections.OrderedDict()
+        self._lock = threading.RLock()
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, stage TEXT NOT NULL, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, expires_at REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_stage ON results (stage)")
+            self._db.commit()
+
+    def snap(self, bounds):
+        # Snap (left, bottom, right, top) to the cache grid so nearly identical rectangles share a key
+        return tuple(round(round(value / self.grid) * self.grid, 10) for value in bounds)
+
+    def key(self, stage, bounds, datasets=(), params=None):
+        cells = [int(round(value / self.grid)) for value in bounds]
+        payload = json.dumps({"stage": stage, "cells": cells, "grid": self.grid,
+                              "datasets": list(datasets), "params": params or {}}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, stage, key):
+        # Returns (True, value) on a hit and (False, None) on a miss
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                _, value, expires_at = entry
+                if expires_at is None or expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.stats[stage]["memory_hits"] += 1
+                    return True, value
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value, expires_at FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value, expires_at = json.loads(row[0]), row[1]
+                    if expires_at is None or expires_at > now:
+                        self._remember(stage, key, value, expires_at)
+                        self.stats[stage]["disk_hits"] += 1
+                        return True, value
+                    self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self.stats[stage]["misses"] += 1
+            return False, None
+
+    def set(self, stage, key, value):
+        ttl = self.ttls.get(stage)
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        with self._lock:
+            self._remember(stage, key, value, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, stage, value, created_at, expires_at) "
+                    "VALUES (?, ?, ?, ?, ?)", (key, stage, json.dumps(value), now, expires_at)
+                )
+                self._db.commit()
+
+    def _remember(self, stage, key, value, expires_at):
+        self._memory[key] = (stage, value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get_or_compute(self, stage, bounds, datasets, params, compute):
+        # Returns the cached result of a stage, computing and storing it on a miss
+        key = self.key(stage, bounds, datasets, params)
+        hit, value = self.get(stage, key)
+        if hit:
+            return value
+        value = compute()
+        self.set(stage, key, value)
+        return value
+
+    def invalidate(self, stage=None, key=None):
+        # Removes the entries of one stage, one key or everything. Returns the number of entries
+        # removed from the persistent store (or from memory when there is none).
+        with self._lock:
+            if key is not None:
+                removed = 1 if self._memory.pop(key, None) is not None else 0
+                where, args = "key = ?", (key,)
+            elif stage is not None:
+                stage_keys = [k for k, entry in self._memory.items() if entry[0] == stage]
+                for k in stage_keys:
+                    del self._memory[k]
+                removed = len(stage_keys)
+                where, args = "stage = ?", (stage,)
+            else:
+                removed = len(self._memory)
+                self._memory.clear()
+                where, args = "1 = 1", ()
+
+            if self._db is not None:
+                removed = self._db.execute(f"DELETE FROM results WHERE {where}", args).rowcount
+                self._db.commit()
+            return removed
+
+    def purge_expired(self):
+        # Drops expired entries from both tiers
+        now = time.time()
+        with self._lock:
+            for key in [k for k, (_, _, expires_at) in self._memory.items()
+                        if expires_at is not None and expires_at <= now]:
+                del self._memory[key]
+            if self._db is not None:
+                self._db.execute("DELETE FROM results WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+                self._db.commit()
+
+    def summary(self):
+        # Hit/miss counters per stage and the size of both tiers
+        with self._lock:
+            stored = None
+            if self._db is not None:
+                stored = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            total = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+            for counters in self.stats.values():
+                for name, count in counters.items():
+                    total[name] += count
+            lookups = sum(total.values())
+            return {
+                "stages": {stage: dict(counters) for stage, counters in self.stats.items()},
+                "total": total,
+                "hit_rate": (total["memory_hits"] + total["disk_hits"]) / lookups if lookups else None,
+                "memory_entries": len(self._memory),
+                "stored_entries": stored,
+                "grid": self.grid,
+                "ttls": self.ttls,
+            }
@@ -0,0 +1,585 @@
+# In-process stand-in for the subset of the Earth Engine Python API used by BlockCarbon.
+#
+# Images are evaluated lazily over a synthetic, deterministic world so that land cover areas,
+# NDVI series and thumbnails can be computed, tested and benchmarked without network access.
+# Every server round trip (getInfo / getThumbURL) is counted in `calls` and can be slowed down
+# with `configure(latency=...)` to mimic a real Earth Engine session.
+
+import collections, datetime, hashlib, math, threading, time
+
+import numpy as np
+
+EARTH_RADIUS = 6371007.2          # Authalic sphere radius (m)
+METERS_PER_DEGREE = 111319.49     # Length of one degree of latitude (m)
+
+calls = collections.Counter()
+_calls_lock = threading.Lock()
+_settings = {"latency": 0.0, "fail": None}
+
+
+class EEException(Exception):
+    pass
+
+
+def Initialize(*args, **kwargs):
+    # Nothing to authenticate against
+    return None
+
+
+def configure(latency=None, fail=None):
+    # Set the simulated round trip latency (seconds, or a callable taking the call kind)
+    # and an optional `fail(kind)` hook that may raise to inject server errors
+    if latency is not None:
+        _settings["latency"] = latency
+    _settings["fail"] = fail
+
+
+def reset():
+    # Clear the round trip counters and restore the default settings
+    with _calls_lock:
+        calls.clear()
+    _settings["latency"] = 0.0
+    _settings["fail"] = None
+
+
+def _round_trip(kind):
+    # Account for one request to the (fake) server
+    with _calls_lock:
+        calls[kind] += 1
+    if _settings["fail"] is not None:
+        _settings["fail"](kind)
+    latency = _settings["latency"]
+    if callable(latency):
+        latency = latency(kind)
+    if latency:
+        time.sleep(latency)
+
+
+def _value(obj):
+    # Resolve lazy objects (ee.Number, ee.Date, ...) to plain Python values
+    if isinstance(obj, ComputedObject):
+        return obj._evaluate()
+    if isinstance(obj, dict):
+        return {key: _value(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_value(value) for value in obj]
+    return obj
+
+
+class ComputedObject:
+    def __init__(self, thunk):
+        self._thunk = thunk
+
+    def _evaluate(self):
+        return self._thunk()
+
+    def getInfo(self):
+        _round_trip("getInfo")
+        return _value(self._evaluate())
+
+    def get(self, key):
+        return ComputedObject(lambda: self._evaluate().get(key))
+
+
+class Number(ComputedObject):
+    def __init__(self, value):
+        super().__init__(lambda: _value(value))
+
+    def int(self):
+        return Number(ComputedObject(lambda: int(self._evaluate())))
+
+    def add(self, other):
+        return Number(ComputedObject(lambda: self._evaluate() + _value(other)))
+
+
+class Dictionary(ComputedObject):
+    def __init__(self, value):
+        super().__init__(lambda: _value(value))
+
+
+class List(ComputedObject):
+    def __init__(self, values):
+        super().__init__(lambda: list(_value(values)))
+
+    @staticmethod
+    def sequence(start, end, step=1):
+        start, end, step = _value(start), _value(end), _value(step)
+        return List(list(range(start, end + 1, step)))
+
+    def map(self, fn):
+        return List(ComputedObject(lambda: [_value(fn(Number(value))) for value in self._evaluate()]))
+
+
+# ---------------------------------------------------------------------------
+# Dates and filters
+# ---------------------------------------------------------------------------
+
+class Date(ComputedObject):
+    def __init__(self, value):
+        super().__init__(lambda: _to_millis(value))
+
+    @staticmethod
+    def fromYMD(year, month, day):
+        return Date(ComputedObject(
+            lambda: _to_millis(datetime.datetime(int(_value(year)), int(_value(month)), int(_value(day))))
+        ))
+
+    def millis(self):
+        return Number(self)
+
+
+def _to_millis(value):
+    value = _value(value)
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if isinstance(value, datetime.datetime):
+        value = value.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000
+    return value
+
+
+class Filter:
+    def __init__(self, predicate):
+        self._predicate = predicate
+
+    @staticmethod
+    def lt(name, value):
+        return Filter(lambda props: props.get(name) is not None and props[name] < _value(value))
+
+    @staticmethod
+    def gt(name, value):
+        return Filter(lambda props: props.get(name) is not None and props[name] > _value(value))
+
+    @staticmethod
+    def eq(name, value):
+        return Filter(lambda props: props.get(name) == _value(value))
+
+    @staticmethod
+    def date(start, end=None):
+        def predicate(props):
+            start_millis = _to_millis(start)
+            end_millis = _to_millis(end) if end is not None else start_millis + 86400000
+            return start_millis <= props["system:time_start"] < end_millis
+        return Filter(predicate)
+
+
+# ---------------------------------------------------------------------------
+# Geometry
+# ---------------------------------------------------------------------------
+
+class Geometry(ComputedObject):
+    def __init__(self, geojson):
+        self._geojson = geojson
+        super().__init__(lambda: self._geojson)
+
+    @staticmethod
+    def Rectangle(coords, *args, **kwargs):
+        if not isinstance(coords, (list, tuple)) or len(coords) != 4:
+            coords = [coords] + list(args[:3])
+        left, bottom, right, top = [float(_value(c)) for c in coords]
+        if left > right or bottom > top:
+            raise EEException("Geometry.Rectangle: invalid coordinates.")
+        ring = [[left, bottom], [right, bottom], [right, top], [left, top], [left, bottom]]
+        return Geometry({"type": "Polygon", "coordinates": [ring], "rectangle": True})
+
+    @staticmethod
+    def Polygon(coords, *args, **kwargs):
+        coords = _value(coords)
+        if coords and not isinstance(coords[0][0], (list, tuple)):
+            coords = [coords]
+        return Geometry({"type": "Polygon", "coordinates": coords})
+
+    @staticmethod
+    def MultiPolygon(coords, *args, **kwargs):
+        return Geometry({"type": "MultiPolygon", "coordinates": _value(coords)})
+
+    def _polygons(self):
+        if self._geojson["type"] == "Polygon":
+            return [self._geojson["coordinates"]]
+        if self._geojson["type"] == "MultiPolygon":
+            return self._geojson["coordinates"]
+        raise EEException(f"Unsupported geometry type: {self._geojson['type']}")
+
+    def _bounds(self):
+        points = [point for polygon in self._polygons() for ring in polygon for point in ring]
+        lons = [point[0] for point in points]
+        lats = [point[1] for point in points]
+        return min(lons), min(lats), max(lons), max(lats)
+
+    def _contains(self, lat, lon):
+        # Boolean mask of pixel centres inside the geometry. Rectangles use half-open bounds so that
+        # adjacent rectangles never share a pixel.
+        if self._geojson.get("rectangle"):
+            left, bottom, right, top = self._bounds()
+            return (lon >= left) & (lon < right) & (lat >= bottom) & (lat < top)
+        inside = np.zeros(np.broadcast(lat, lon).shape, dtype=bool)
+        for polygon in self._polygons():
+            polygon_mask = np.zeros_like(inside)
+            for ring in polygon:
+                polygon_mask ^= _ring_mask(ring, lat, lon)
+            inside |= polygon_mask
+        return inside
+
+    def bounds(self):
+        return Geometry.Rectangle(list(self._bounds()))
+
+
+def _ring_mask(ring, lat, lon):
+    # Even-odd ray casting test for every pixel centre against one linear ring
+    inside = np.zeros(np.broadcast(lat, lon).shape, dtype=bool)
+    points = list(ring)
+    if points[0] != points[-1]:
+        points.append(points[0])
+    for (x1, y1), (x2, y2) in zip(points[:-1], points[1:]):
+        if y1 == y2:
+            continue
+        crosses = (y1 > lat) != (y2 > lat)
+        x_intersect = x1 + (lat - y1) * (x2 - x1) / (y2 - y1)
+        inside ^= crosses & (lon < x_intersect)
+    return inside
+
+
+# ---------------------------------------------------------------------------
+# Pixel grids and synthetic datasets
+# ---------------------------------------------------------------------------
+
+class _Grid:
+    # Pixel centres of a globally aligned lat/lon grid covering a geometry at the given scale (m)
+    def __init__(self, geometry, scale):
+        self.step = scale / METERS_PER_DEGREE
+        left, bottom, right, top = geometry._bounds()
+        rows = np.arange(math.floor(bottom / self.step), math.ceil(top / self.step) + 1)
+        cols = np.arange(math.floor(left / self.step), math.ceil(right / self.step) + 1)
+        self.lat = ((rows + 0.5) * self.step)[:, None]
+        self.lon = ((cols + 0.5) * self.step)[None, :]
+        self.shape = (len(rows), len(cols))
+        self.inside = geometry._contains(self.lat, self.lon)
+
+    def pixel_area(self):
+        # Area (m²) of each pixel on the authalic sphere
+        half = self.step / 2
+        band = np.sin(np.radians(self.lat + half)) - np.sin(np.radians(self.lat - half))
+        return np.broadcast_to(EARTH_RADIUS ** 2 * np.radians(self.step) * band, self.shape)
+
+
+def _full(band, grid):
+    # Broadcast a (possibly masked) band to the full grid shape, keeping its mask
+    band = np.ma.asarray(band)
+    return np.ma.masked_array(np.broadcast_to(band.data, grid.shape),
+                              mask=np.broadcast_to(np.ma.getmaskarray(band), grid.shape))
+
+
+def _cell_hash(lat, lon, cell, salt):
+    # Deterministic pseudo-random integer in [0, 1000) for each `cell`-degree cell
+    i = np.floor(lat / cell).astype(np.int64)
+    j = np.floor(lon / cell).astype(np.int64)
+    h = (i * 73856093) ^ (j * 19349663) ^ (salt * 83492791)
+    return (h ^ (h >> 13)) % 1000
+
+
+# Relative frequency (per mille) of each ESA WorldCover class in the synthetic world
+_WORLDCOVER_WEIGHTS = [(10, 300), (20, 120), (30, 180), (40, 170), (50, 60),
+                       (60, 60), (70, 10), (80, 60), (90, 40)]
+_VEGETATED = (10, 20, 30, 40, 90)
+
+
+def _worldcover(lat, lon):
+    lat, lon = np.broadcast_arrays(lat, lon)
+    h = _cell_hash(lat, lon, 0.002, 1)
+    classes = np.zeros(h.shape, dtype=np.int64)
+    threshold = 0
+    for class_value, weight in _WORLDCOVER_WEIGHTS:
+        classes[(h >= threshold) & (h < threshold + weight)] = class_value
+        threshold += weight
+    return classes
+
+
+def _reflectance(lat, lon, year, scene, red_band, nir_band, extra_bands=()):
+    # Surface reflectance bands derived from the synthetic land cover, with slow regrowth over the
+    # years and per scene noise
+    classes = _worldcover(lat, lon)
+    vegetated = np.isin(classes, _VEGETATED)
+    greening = _cell_hash(lat, lon, 0.004, year * 31 + scene) / 1000.0
+    regrowth = (_cell_hash(lat, lon, 0.003, 7) / 1000.0) < (year - 2010) * 0.03
+    vegetation = np.where(vegetated | regrowth, 0.55 + 0.35 * greening, 0.05 + 0.15 * greening)
+    red = 0.25 - 0.18 * vegetation
+    nir = 0.15 + 0.45 * vegetation
+    bands = {red_band: red, nir_band: nir}
+    for name in extra_bands:
+        bands[name] = red * 0.9
+    return {name: np.ma.masked_array(value * 10000) for name, value in bands.items()}
+
+
+def _scenes(dataset, cloud_property, red_band, nir_band, extra_bands, first_year, last_year):
+    images = []
+    for year in range(first_year, last_year + 1):
+        for scene, month in enumerate((2, 5, 8, 11)):
+            props = {
+                "system:id": f"{dataset}/{year}{month:02d}",
+                "system:time_start": _to_millis(datetime.datetime(year, month, 15)),
+                cloud_property: (year * 7 + month * 13) % 50,
+            }
+
+            def bands(grid, year=year, scene=scene):
+                return _reflectance(grid.lat, grid.lon, year, scene, red_band, nir_band, extra_bands)
+
+            images.append(Image(_bands=bands, _props=props))
+    return images
+
+
+_COLLECTIONS = {
+    "LANDSAT/LE07/C02/T1_L2": lambda: _scenes(
+        "LANDSAT/LE07/C02/T1_L2", "CLOUD_COVER", "SR_B3", "SR_B4", ("SR_B2",), 1999, 2024),
+    "COPERNICUS/S2_SR_HARMONIZED": lambda: _scenes(
+        "COPERNICUS/S2_SR_HARMONIZED", "CLOUDY_PIXEL_PERCENTAGE", "B4", "B8", ("B3", "B2"), 2017, 2024),
+}
+
+_IMAGES = {
+    "ESA/WorldCover/v200/2021": lambda grid: {"Map": np.ma.masked_array(_worldcover(grid.lat, grid.lon))},
+    "ESA/WorldCover/v100/2020": lambda grid: {"Map": np.ma.masked_array(_worldcover(grid.lat, grid.lon))},
+}
+
+
+# ---------------------------------------------------------------------------
+# Images and collections
+# ---------------------------------------------------------------------------
+
+class Image(ComputedObject):
+    def __init__(self, source=None, _bands=None, _props=None, _label=None):
+        if _bands is None:
+            if isinstance(source, Image):
+                _bands, _props, _label = source._bands, source._props, source._label
+            elif isinstance(source, str):
+                if source not in _IMAGES:
+                    raise EEException(f"Image.load: Image asset '{source}' not found.")
+                _bands, _label = _IMAGES[source], source
+            elif isinstance(_value(source), (int, float)):
+                source = _value(source)
+                _bands, _label = (lambda grid, c=source: {"constant": np.ma.masked_array(
+                    np.full(grid.shape, c, dtype=float))}), repr(source)
+            else:
+                _bands = lambda grid: {}
+        self._bands = _bands
+        self._props = dict(_props or {})
+        self._label = _label or "image"
+        super().__init__(lambda: {"type": "Image", "properties": self._props})
+
+    def _derive(self, fn, label):
+        return Image(_bands=lambda grid: fn(self._bands(grid), grid), _props=self._props,
+                     _label=f"{label}({self._label})")
+
+    @staticmethod
+    def pixelArea():
+        return Image(_bands=lambda grid: {"area": np.ma.masked_array(grid.pixel_area())},
+                     _label="pixelArea")
+
+    @staticmethod
+    def constant(value):
+        return Image(value)
+
+    def select(self, *names):
+        if len(names) == 1 and isinstance(names[0], (list, tuple)):
+            names = names[0]
+
+        def fn(bands, grid):
+            missing = [name for name in names if name not in bands]
+            if missing:
+                raise EEException(f"Image.select: Band '{missing[0]}' not found.")
+            return {name: bands[name] for name in names}
+        return self._derive(fn, "select")
+
+    def rename(self, *names):
+        if len(names) == 1 and isinstance(names[0], (list, tuple)):
+            names = names[0]
+        return self._derive(lambda bands, grid: dict(zip(names, bands.values())), "rename")
+
+    def addBands(self, other, names=None, overwrite=False):
+        def fn(bands, grid):
+            merged = dict(bands)
+            merged.update(other._bands(grid))
+            return merged
+        return self._derive(fn, "addBands")
+
+    def _binary(self, other, op, label, cast=None):
+        def fn(bands, grid):
+            if isinstance(other, Image):
+                other_bands = list(other._bands(grid).values())
+            else:
+                other_bands = [_value(other)]
+            result = {}
+            for index, (name, band) in enumerate(bands.items()):
+                right = other_bands[index] if len(other_bands) > 1 else other_bands[0]
+                value = op(band, right)
+                result[name] = value.astype(cast) if cast else value
+            return result
+        return self._derive(fn, label)
+
+    def eq(self, other):
+        return self._binary(other, lambda a, b: a == b, "eq", int)
+
+    def neq(self, other):
+        return self._binary(other, lambda a, b: a != b, "neq", int)
+
+    def gt(self, other):
+        return self._binary(other, lambda a, b: a > b, "gt", int)
+
+    def gte(self, other):
+        return self._binary(other, lambda a, b: a >= b, "gte", int)
+
+    def lt(self, other):
+        return self._binary(other, lambda a, b: a < b, "lt", int)
+
+    def lte(self, other):
+        return self._binary(other, lambda a, b: a <= b, "lte", int)
+
+    def add(self, other):
+        return self._binary(other, lambda a, b: a + b, "add")
+
+    def subtract(self, other):
+        return self._binary(other, lambda a, b: a - b, "subtract")
+
+    def multiply(self, other):
+        return self._binary(other, lambda a, b: a * b, "multiply")
+
+    def divide(self, other):
+        return self._binary(other, lambda a, b: a / b, "divide")
+
+    def updateMask(self, mask):
+        def fn(bands, grid):
+            mask_bands = list(mask._bands(grid).values())
+            if not mask_bands:
+                # An image without bands (e.g. the median of an empty collection) masks everything
+                mask_bands = [np.ma.masked_all(grid.shape)]
+            keep = np.ma.filled(_full(mask_bands[0], grid), 0) != 0
+            return {name: np.ma.masked_where(~keep, _full(band, grid)) for name, band in bands.items()}
+        return self._derive(fn, "updateMask")
+
+    def clip(self, geometry):
+        def fn(bands, grid):
+            outside = ~geometry._contains(grid.lat, grid.lon)
+            return {name: np.ma.masked_where(np.broadcast_to(outside, grid.shape), _full(band, grid))
+                    for name, band in bands.items()}
+        return self._derive(fn, "clip")
+
+    def normalizedDifference(self, names):
+        def fn(bands, grid):
+            first, second = bands[names[0]].astype(float), bands[names[1]].astype(float)
+            return {"nd": (first - second) / (first + second)}
+        return self._derive(fn, "normalizedDifference")
+
+    def visualize(self, **params):
+        return self._derive(lambda bands, grid: bands, f"visualize{sorted(params.items())!r}")
+
+    def set(self, *args):
+        props = dict(self._props)
+        if len(args) == 1:
+            props.update(args[0])
+        else:
+            props[args[0]] = args[1]
+        return Image(_bands=self._bands, _props=props, _label=self._label)
+
+    def getThumbURL(self, params=None):
+        _round_trip("getThumbURL")
+        params = dict(params or {})
+        if isinstance(params.get("region"), Geometry):
+            params["region"] = params["region"]._bounds()
+        params = _value(params)
+        digest = hashlib.sha1(f"{self._label}|{sorted(params.items())!r}".encode()).hexdigest()[:32]
+        return f"https://earthengine.fake/v1/thumbnails/{digest}:getPixels"
+
+    def reduceRegion(self, reducer, geometry=None, scale=None, maxPixels=1e7, **kwargs):
+        def thunk():
+            grid = _Grid(geometry, scale or 1000)
+            pixels = grid.shape[0] * grid.shape[1]
+            if pixels > maxPixels:
+                raise EEException(
+                    f"Image.reduceRegion: Too many pixels in the region. "
+                    f"Found {pixels}, but maxPixels allows only {int(maxPixels)}."
+                )
+            bands = {name: np.ma.masked_where(~np.broadcast_to(grid.inside, grid.shape), _full(band, grid))
+                     for name, band in self._bands(grid).items()}
+            return reducer._reduce(bands)
+        return Dictionary(ComputedObject(thunk))
+
+
+class ImageCollection(ComputedObject):
+    def __init__(self, source):
+        if isinstance(source, str):
+            if source not in _COLLECTIONS:
+                raise EEException(f"ImageCollection.load: ImageCollection asset '{source}' not found.")
+            images = _COLLECTIONS[source]()
+        else:
+            images = list(source)
+        self._images = images
+        super().__init__(lambda: {"type": "ImageCollection", "features": [
+            {"type": "Image", "properties": image._props} for image in self._images]})
+
+    def filter(self, filter_):
+        return ImageCollection([image for image in self._images if filter_._predicate(image._props)])
+
+    def filterDate(self, start, end=None):
+        return self.filter(Filter.date(start, end))
+
+    def filterBounds(self, geometry):
+        # Synthetic scenes cover the whole globe
+        return ImageCollection(self._images)
+
+    def map(self, fn):
+        return ImageCollection([fn(image) for image in self._images])
+
+    def select(self, *names):
+        return self.map(lambda image: image.select(*names))
+
+    def size(self):
+        return Number(len(self._images))
+
+    def median(self):
+        images = self._images
+
+        def fn(grid):
+            if not images:
+                return {}
+            stacks = [image._bands(grid) for image in images]
+            return {name: np.ma.median(np.ma.stack([_full(bands[name], grid) for bands in stacks]), axis=0)
+                    for name in stacks[0]}
+        return Image(_bands=fn, _label="median")
+
+
+# ---------------------------------------------------------------------------
+# Features and reducers
+# ---------------------------------------------------------------------------
+
+class Feature(ComputedObject):
+    def __init__(self, geometry, properties=None):
+        super().__init__(lambda: {"type": "Feature", "geometry": None,
+                                  "properties": _value(properties or {})})
+
+
+class FeatureCollection(ComputedObject):
+    def __init__(self, features):
+        super().__init__(lambda: {"type": "FeatureCollection", "features": _value(features)})
+
+
+class Reducer:
+    def __init__(self, reduce_fn):
+        self._reduce = reduce_fn
+
+    @staticmethod
+    def sum():
+        def reduce(bands):
+            return {name: float(band.sum()) if band.count() else 0 for name, band in bands.items()}
+        reducer = Reducer(reduce)
+        reducer._sum = True
+        return reducer
+
+    def group(self, groupField=0, groupName="group"):
+        def reduce(bands):
+            names = list(bands)
+            keys = bands[names[groupField]]
+            values = bands[names[0] if groupField != 0 else names[1]]
+            valid = ~np.ma.getmaskarray(keys) & ~np.ma.getmaskarray(values)
+            key_values = np.asarray(keys)[valid]
+            totals = np.bincount(np.searchsorted(np.unique(key_values), key_values),
+                                 weights=np.asarray(values, dtype=float)[valid])
+            return {"groups": [{groupName: int(key), "sum": float(total)}
+                               for key, total in zip(np.unique(key_values), totals)]}
+        return Reducer(reduce)
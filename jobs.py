@@ -0,0 +1,197 @@
+# Background analysis jobs.
+#
+# A job is a set of named stages with dependencies between them. Stages run on a bounded thread pool
+# shared by all jobs, so independent stages (thumbnails, class areas, NDVI series) overlap while the
+# number of concurrent Earth Engine requests stays capped. Jobs report per-stage progress and partial
+# results, and can be cancelled or timed out. The time limit counts from the start of the first stage,
+# not from submission, and a cancelled or timed out stage stops (freeing its worker) the next time it
+# reports progress.
+
+import threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED, TIMED_OUT = "queued", "running", "done", "failed", "cancelled", "timed_out"
+FINISHED = (DONE, FAILED, CANCELLED, TIMED_OUT)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Stage:
+    # `fn(results, progress)` receives the results of the stages named in `requires` and a callback
+    # taking the completed fraction (0-1) of the stage. The callback raises JobCancelled once the job
+    # is cancelled or timed out, so stages should call it between steps (e.g. Earth Engine round trips).
+    def __init__(self, name, fn, requires=()):
+        self.name = name
+        self.fn = fn
+        self.requires = tuple(requires)
+
+
+class Job:
+    def __init__(self, stages, timeout=None, context=None):
+        self.id = uuid.uuid4().hex
+        self.stages = {stage.name: stage for stage in stages}
+        self.context = context or {}
+        self.status = QUEUED
+        self.error = None
+        self.results = {}
+        self.stage_status = {name: {"status": QUEUED, "progress": 0.0, "error": None,
+                                    "started_at": None, "finished_at": None} for name in self.stages}
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.timeout = timeout
+        self.deadline = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._futures = {}
+        self._timer = None
+
+        for stage in stages:
+            unknown = [name for name in stage.requires if name not in self.stages]
+            if unknown:
+                raise ValueError(f"Stage {stage.name!r} requires unknown stage {unknown[0]!r}")
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    def check_cancelled(self):
+        # Stages call this between steps so cancelled or timed out jobs stop early
+        if self.finished and self.status != DONE:
+            raise JobCancelled(self.status)
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def progress(self):
+        return sum(stage["progress"] for stage in self.stage_status.values()) / max(len(self.stages), 1)
+
+    def to_dict(self):
+        # Status report with the results of the stages that have finished so far
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "error": self.error,
+                "progress": round(self.progress(), 4),
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "deadline": self.deadline,
+                "finished_at": self.finished_at,
+                "stages": {name: dict(status) for name, status in self.stage_status.items()},
+                "results": dict(self.results),
+            }
+
+
+class JobManager:
+    def __init__(self, max_workers=4, timeout=120, retention=3600):
+        # `timeout` is the default time (s) a job may take, `retention` how long finished jobs are kept
+        self.timeout = timeout
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, stages, timeout=None, context=None):
+        # Creates a job and starts every stage without unfinished requirements
+        job = Job(stages, timeout if timeout is not None else self.timeout, context)
+        with self._lock:
+            self._forget_old_jobs()
+            self._jobs[job.id] = job
+        if not job.stages:
+            self._finish(job, DONE)
+        self._schedule(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        # Cancels a job; queued stages are dropped and running ones are discarded when they return
+        job = self.get(job_id)
+        if job is not None:
+            self._finish(job, CANCELLED, "Job cancelled")
+        return job
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _forget_old_jobs(self):
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def _schedule(self, job):
+        with job._lock:
+            if job.finished:
+                return
+            ready = [stage for name, stage in job.stages.items()
+                     if job.stage_status[name]["status"] == QUEUED and name not in job._futures
+                     and all(job.stage_status[req]["status"] == DONE for req in stage.requires)]
+            for stage in ready:
+                job._futures[stage.name] = self._executor.submit(self._run_stage, job, stage)
+
+    def _run_stage(self, job, stage):
+        with job._lock:
+            if job.finished:
+                return
+            job.status = RUNNING
+            if job.started_at is None:
+                # Start the clock when the job gets its first worker, not while it waits in the queue
+                job.started_at = time.time()
+                if job.timeout:
+                    job.deadline = job.started_at + job.timeout
+                    job._timer = threading.Timer(job.timeout, self._finish, (job, TIMED_OUT, "Job timed out"))
+                    job._timer.daemon = True
+                    job._timer.start()
+            status = job.stage_status[stage.name]
+            status["status"] = RUNNING
+            status["started_at"] = time.time()
+            inputs = {name: job.results[name] for name in stage.requires}
+
+        def progress(fraction):
+            job.check_cancelled()
+            status["progress"] = min(max(float(fraction), 0.0), 1.0)
+
+        try:
+            result = stage.fn(inputs, progress)
+        except JobCancelled:
+            return
+        except Exception as e:
+            with job._lock:
+                status["status"] = FAILED
+                status["error"] = str(e)
+                status["finished_at"] = time.time()
+            self._finish(job, FAILED, f"Stage {stage.name!r} failed: {e}")
+            return
+
+        with job._lock:
+            if job.finished:
+                return
+            job.results[stage.name] = result
+            status.update(status=DONE, progress=1.0, finished_at=time.time())
+            complete = all(s["status"] == DONE for s in job.stage_status.values())
+        if complete:
+            self._finish(job, DONE)
+        else:
+            self._schedule(job)
+
+    def _finish(self, job, status, error=None):
+        with job._lock:
+            if job.finished:
+                return
+            job.status = status
+            job.error = error
+            job.finished_at = time.time()
+            for future in job._futures.values():
+                future.cancel()
+            for stage_status in job.stage_status.values():
+                if stage_status["status"] in (QUEUED, RUNNING):
+                    stage_status["status"] = TIMED_OUT if status == TIMED_OUT else CANCELLED
+        if job._timer is not None and status != TIMED_OUT:
+            job._timer.cancel()
+        job._done.set()
@@ -0,0 +1,81 @@
+# Land cover area engine.
+#
+# A land cover source returns the area (m²) covered by every class value inside a region in a single
+# request. Regions are (left, bottom, right, top) bounding boxes or GeoJSON Polygon / MultiPolygon
+# geometries. `landcover_areas` turns that into the {class name: hectares} dict used by
+# calculate_baseline, calculate_carbon_stocks and results.html.
+#
+# With a `tiling` planner (see tiling.py) regions too large for one reduction are reduced tile by
+# tile and the per-class sums are merged. Sources take an optional `call(fn)` that performs each
+# Earth Engine round trip (e.g. with rate limiting and retries); sources without round trips ignore it.
+# An optional `progress(fraction)` callback is called as the work advances (and may raise to stop it).
+
+from metrics import timed_call
+
+WORLDCOVER_DATASET = "ESA/WorldCover/v200/2021"
+
+
+def region_bounds(region):
+    # (left, bottom, right, top) of a bounding box or GeoJSON Polygon / MultiPolygon
+    if isinstance(region, dict):
+        polygons = [region["coordinates"]] if region["type"] == "Polygon" else region["coordinates"]
+        points = [point for polygon in polygons for ring in polygon for point in ring]
+        longitudes = [float(point[0]) for point in points]
+        latitudes = [float(point[1]) for point in points]
+        return min(longitudes), min(latitudes), max(longitudes), max(latitudes)
+    return tuple(region)
+
+
+class EarthEngineLandcover:
+    # Land cover source backed by an Earth Engine classified image (ESA WorldCover by default).
+    # `ee_module` can be the real `ee` package or the in-process `fake_ee` stand-in.
+    def __init__(self, ee_module, dataset=WORLDCOVER_DATASET, band="Map", scale=30, max_pixels=1e9, tiling=None):
+        self.ee = ee_module
+        self.dataset = dataset
+        self.band = band
+        self.scale = scale
+        self.max_pixels = max_pixels
+        self.tiling = tiling
+
+    def geometry(self, region):
+        if isinstance(region, dict):
+            return self.ee.Geometry(region)
+        return self.ee.Geometry.Rectangle(list(region))
+
+    def class_pixel_areas(self, region, call=None, progress=None):
+        if self.tiling is None:
+            reduce = lambda: self._reduce(self.geometry(region), None, self.scale)
+            return call(reduce) if call is not None else reduce()
+
+        # Reduce every tile of the bounding box, clipped to the polygon for GeoJSON regions
+        polygon = self.geometry(region) if isinstance(region, dict) else None
+        tile_areas = lambda tile, scale: self._reduce(self.ee.Geometry.Rectangle(list(tile)), polygon, scale)
+        return self.tiling.reduce(region_bounds(region), self.scale, tile_areas, call=call, progress=progress)
+
+    def _reduce(self, geometry, clip, scale):
+        # Sum the pixel area of every class with one grouped reduction (a single getInfo round trip)
+        ee = self.ee
+        landcover = ee.Image(self.dataset).select(self.band)
+        if clip is not None:
+            landcover = landcover.clip(clip)
+        grouped = ee.Image.pixelArea().addBands(landcover).reduceRegion(
+            reducer=ee.Reducer.sum().group(groupField=1, groupName="class"),
+            geometry=geometry,
+            scale=scale,
+            maxPixels=self.max_pixels
+        )
+        grouped = timed_call("getInfo", grouped.getInfo)
+
+        return {int(group["class"]): group["sum"] for group in grouped.get("groups", [])}
+
+
+def landcover_areas(source, region, landcover_classes, call=None, progress=None):
+    # Calculates the area (ha) of each land cover class inside `region`
+    class_areas = source.class_pixel_areas(region, call=call, progress=progress)
+
+    areas = {}
+    for class_value, class_info in landcover_classes.items():
+        # Convert the area to hectares (1 hectare = 10,000 m²)
+        area = class_areas.get(class_value)
+        areas[class_info["name"]] = area / 10000 if area else 0
+    return areas
@@ -0,0 +1,186 @@
+# Land cover source reading classified rasters (ESA WorldCover style) from local disk.
+#
+# Tiles are north-up lat/lon grids listed in a `tiles.json` manifest. Raw tiles (.npy or headerless
+# .bin files) are memory-mapped and GeoTIFF tiles are read through rasterio windows, so a query only
+# touches the part of the tiles that intersects the AOI. Class pixels are counted with NumPy in row
+# strips, weighting every row by its latitude dependent pixel area.
+
+import json, math, os
+
+import numpy as np
+
+from landcover import WORLDCOVER_DATASET, region_bounds
+
+try:
+    import rasterio
+    from rasterio.windows import Window
+except ImportError:
+    rasterio = None
+
+EARTH_RADIUS = 6371007.2      # Authalic sphere radius (m)
+MANIFEST = "tiles.json"
+STRIP_ROWS = 1024             # Rows read and counted at a time
+
+
+class RasterTile:
+    # One north-up tile covering `bounds` (left, bottom, right, top) with `shape` (rows, cols) pixels
+    def __init__(self, path, bounds, shape, dtype="uint8"):
+        self.path = path
+        self.bounds = tuple(float(value) for value in bounds)
+        self.shape = tuple(int(value) for value in shape)
+        self.dtype = np.dtype(dtype)
+        self._data = None
+
+    @property
+    def pixel_size(self):
+        left, bottom, right, top = self.bounds
+        return (right - left) / self.shape[1], (top - bottom) / self.shape[0]
+
+    def intersects(self, bounds):
+        left, bottom, right, top = bounds
+        return left < self.bounds[2] and right > self.bounds[0] and bottom < self.bounds[3] and top > self.bounds[1]
+
+    def window(self, bounds):
+        # Rows and columns whose pixel centres fall inside the half-open bounds
+        left, bottom, right, top = bounds
+        dx, dy = self.pixel_size
+        row_start = math.floor((self.bounds[3] - top) / dy - 0.5) + 1
+        row_stop = math.floor((self.bounds[3] - bottom) / dy - 0.5) + 1
+        col_start = math.ceil((left - self.bounds[0]) / dx - 0.5)
+        col_stop = math.ceil((right - self.bounds[0]) / dx - 0.5)
+        rows, cols = self.shape
+        return (min(max(row_start, 0), rows), min(max(row_stop, 0), rows),
+                min(max(col_start, 0), cols), min(max(col_stop, 0), cols))
+
+    def read(self, row_start, row_stop, col_start, col_stop):
+        if self.path.endswith((".tif", ".tiff")):
+            with rasterio.open(self.path) as src:
+                window = Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+                return src.read(1, window=window)
+        if self._data is None:
+            if self.path.endswith(".npy"):
+                self._data = np.load(self.path, mmap_mode="r")
+            else:
+                self._data = np.memmap(self.path, dtype=self.dtype, mode="r", shape=self.shape)
+        return self._data[row_start:row_stop, col_start:col_stop]
+
+
+def load_tiles(tile_dir):
+    # Tiles listed in the manifest of `tile_dir`; without one, every GeoTIFF in the directory
+    manifest_path = os.path.join(tile_dir, MANIFEST)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            entries = json.load(f)["tiles"]
+        tiles = [RasterTile(os.path.join(tile_dir, entry["path"]), entry["bounds"], entry["shape"],
+                            entry.get("dtype", "uint8")) for entry in entries]
+    else:
+        tiles = []
+        for name in sorted(os.listdir(tile_dir)):
+            if name.endswith((".tif", ".tiff")):
+                if rasterio is None:
+                    raise RuntimeError("Reading GeoTIFF land cover tiles requires rasterio")
+                with rasterio.open(os.path.join(tile_dir, name)) as src:
+                    tiles.append(RasterTile(os.path.join(tile_dir, name), src.bounds, src.shape, src.dtypes[0]))
+
+    if any(tile.path.endswith((".tif", ".tiff")) for tile in tiles) and rasterio is None:
+        raise RuntimeError("Reading GeoTIFF land cover tiles requires rasterio")
+    return tiles
+
+
+def save_tile(tile_dir, name, classes, bounds):
+    # Writes a class array as a raw .npy tile and registers it in the manifest
+    os.makedirs(tile_dir, exist_ok=True)
+    path = name if name.endswith(".npy") else name + ".npy"
+    np.save(os.path.join(tile_dir, path), np.asarray(classes))
+
+    manifest_path = os.path.join(tile_dir, MANIFEST)
+    entries = []
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            entries = [entry for entry in json.load(f)["tiles"] if entry["path"] != path]
+    entries.append({"path": path, "bounds": list(bounds), "shape": list(np.shape(classes)),
+                    "dtype": str(np.asarray(classes).dtype)})
+    with open(manifest_path, "w") as f:
+        json.dump({"tiles": entries}, f, indent=2)
+
+
+def row_pixel_areas(top, dy, dx, rows):
+    # Area (m²) of the pixels in each of `rows` rows starting at latitude `top`
+    edges = np.radians(top - dy * np.arange(rows + 1))
+    return EARTH_RADIUS ** 2 * math.radians(dx) * (np.sin(edges[:-1]) - np.sin(edges[1:]))
+
+
+def polygon_mask(geometry, lat, lon):
+    # Rasterizes a GeoJSON Polygon / MultiPolygon: True for pixel centres inside (even-odd rule).
+    # `lat` is a column of row centres and `lon` a row of evenly spaced column centres.
+    polygons = [geometry["coordinates"]] if geometry["type"] == "Polygon" else geometry["coordinates"]
+    lat = np.ravel(lat)
+    lon = np.ravel(lon)
+    step = lon[1] - lon[0] if len(lon) > 1 else 1.0
+    inside = np.zeros((len(lat), len(lon)), dtype=bool)
+    rows = np.arange(len(lat))[:, None]
+
+    for polygon in polygons:
+        # Toggle the parity at the first pixel centre right of every edge crossing of each row
+        toggles = np.zeros((len(lat), len(lon) + 1), dtype=np.int32)
+        for ring in polygon:
+            ring = np.asarray(ring, dtype=float)
+            x1, y1, x2, y2 = ring[:-1, 0], ring[:-1, 1], ring[1:, 0], ring[1:, 1]
+            crosses = (y1 > lat[:, None]) != (y2 > lat[:, None])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                x = x1 + (lat[:, None] - y1) * (x2 - x1) / (y2 - y1)
+            columns = np.clip(np.ceil((x - lon[0]) / step), 0, len(lon)).astype(np.int64)
+            np.add.at(toggles, (np.broadcast_to(rows, crosses.shape)[crosses], columns[crosses]), 1)
+        inside |= (np.cumsum(toggles[:, :-1], axis=1) % 2).astype(bool)
+    return inside
+
+
+class LocalRasterLandcover:
+    # Land cover source reading classified tiles from `tile_dir`. Pixels equal to `nodata` are ignored.
+    def __init__(self, tile_dir, dataset=WORLDCOVER_DATASET, nodata=0):
+        self.tile_dir = tile_dir
+        self.dataset = dataset
+        self.nodata = nodata
+        self.scale = "native"
+        self.tiles = load_tiles(tile_dir)
+
+    def class_pixel_areas(self, region, call=None, progress=None):
+        bounds = region_bounds(region)
+        totals = np.zeros(256)
+        tiles = [tile for tile in self.tiles if tile.intersects(bounds)]
+        for done, tile in enumerate(tiles):
+            if progress is not None:
+                progress(done / len(tiles))
+            totals += self._tile_class_areas(tile, bounds, region if isinstance(region, dict) else None)
+        return {class_value: float(total) for class_value, total in enumerate(totals)
+                if total > 0 and class_value != self.nodata}
+
+    def _tile_class_areas(self, tile, bounds, polygon):
+        # Per-class area (m²) inside one tile
+        return window_class_areas(tile, *tile.window(bounds), polygon=polygon)
+
+
+def window_class_areas(tile, row_start, row_stop, col_start, col_stop, polygon=None):
+    # Per-class area (m²) of a pixel window of `tile` (optionally only the pixels inside a GeoJSON
+    # polygon), counted in strips of STRIP_ROWS rows
+    totals = np.zeros(256)
+    if row_start >= row_stop or col_start >= col_stop:
+        return totals
+
+    dx, dy = tile.pixel_size
+    tile_left, tile_top = tile.bounds[0], tile.bounds[3]
+    lon = tile_left + (np.arange(col_start, col_stop) + 0.5) * dx
+    for strip_start in range(row_start, row_stop, STRIP_ROWS):
+        strip_stop = min(strip_start + STRIP_ROWS, row_stop)
+        classes = np.asarray(tile.read(strip_start, strip_stop, col_start, col_stop)).astype(np.int64)
+        rows = strip_stop - strip_start
+        row_areas = row_pixel_areas(tile_top - strip_start * dy, dy, dx, rows)
+
+        # Count pixels per (row, class) and weight every row by its pixel area
+        keys = classes + 256 * np.arange(rows)[:, None]
+        if polygon is not None:
+            lat = tile_top - (np.arange(strip_start, strip_stop) + 0.5) * dy
+            keys = keys[polygon_mask(polygon, lat, lon)]
+        counts = np.bincount(keys.ravel(), minlength=256 * rows).reshape(rows, 256)
+        totals += row_areas @ counts
+    return totals
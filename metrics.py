@@ -0,0 +1,195 @@
+# Latency instrumentation.
+#
+# `registry` collects process-wide Prometheus metrics: wall time of the analysis stages, the number,
+# duration and failures of Earth Engine round trips and HTTP request latency. A `Timings` object
+# collects the same measurements for a single request or job so they can be returned in a
+# Server-Timing header. Earth Engine calls made while a `Timings` is being recorded in the current
+# context (thread, or work submitted with a copy of the context) are added to it.
+
+import bisect, contextvars, threading, time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = [(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+               for name, value in pairs]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def counter(self, name, help_text, labels=()):
+        self._metrics[name] = {"type": "counter", "help": help_text, "labels": tuple(labels), "values": {}}
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self._metrics[name] = {"type": "histogram", "help": help_text, "labels": tuple(labels),
+                               "buckets": tuple(buckets), "values": {}}
+
+    def collector(self, fn):
+        # Registers `fn()` returning [(name, type, help, [(labels dict, value), ...]), ...], evaluated
+        # when the metrics are rendered (for values owned by other components, e.g. the cache)
+        self._collectors.append(fn)
+        return fn
+
+    def _key(self, metric, labels):
+        return tuple(str(labels.get(name, "")) for name in metric["labels"])
+
+    def inc(self, name, amount=1, **labels):
+        metric = self._metrics[name]
+        key = self._key(metric, labels)
+        with self._lock:
+            metric["values"][key] = metric["values"].get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        metric = self._metrics[name]
+        key = self._key(metric, labels)
+        with self._lock:
+            state = metric["values"].get(key)
+            if state is None:
+                state = metric["values"][key] = {"buckets": [0] * len(metric["buckets"]), "sum": 0.0, "count": 0}
+            index = bisect.bisect_left(metric["buckets"], value)
+            if index < len(metric["buckets"]):
+                state["buckets"][index] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def reset(self):
+        with self._lock:
+            for metric in self._metrics.values():
+                metric["values"].clear()
+
+    def render(self):
+        # Prometheus text exposition format
+        lines = []
+        with self._lock:
+            for name, metric in self._metrics.items():
+                lines.append(f"# HELP {name} {metric['help']}")
+                lines.append(f"# TYPE {name} {metric['type']}")
+                for key, value in sorted(metric["values"].items()):
+                    if metric["type"] == "counter":
+                        lines.append(f"{name}{_format_labels(metric['labels'], key)} {_format_value(value)}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(metric["buckets"], value["buckets"]):
+                        cumulative += count
+                        labels = _format_labels(metric["labels"], key, [("le", _format_value(float(bound)))])
+                        lines.append(f"{name}_bucket{labels} {cumulative}")
+                    labels = _format_labels(metric["labels"], key, [("le", "+Inf")])
+                    lines.append(f"{name}_bucket{labels} {value['count']}")
+                    lines.append(f"{name}_sum{_format_labels(metric['labels'], key)} {_format_value(value['sum'])}")
+                    lines.append(f"{name}_count{_format_labels(metric['labels'], key)} {value['count']}")
+
+        for collector in self._collectors:
+            for name, metric_type, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Metrics()
+registry.histogram("blockcarbon_stage_seconds", "Wall time of analysis stages.", ["stage"])
+registry.counter("blockcarbon_earth_engine_requests_total", "Earth Engine round trips.", ["method"])
+registry.counter("blockcarbon_earth_engine_request_errors_total", "Earth Engine round trips that failed.", ["method"])
+registry.histogram("blockcarbon_earth_engine_request_seconds", "Duration of Earth Engine round trips.", ["method"])
+registry.histogram("blockcarbon_http_request_seconds", "Duration of HTTP requests.", ["endpoint", "method"])
+
+
+class Timings:
+    # Stage durations and Earth Engine round trips of one request or job
+    def __init__(self):
+        self.stages = []
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.stages.append((name, seconds))
+
+    def add_call(self, method, seconds):
+        with self._lock:
+            count, total = self.calls.get(method, (0, 0.0))
+            self.calls[method] = (count + 1, total + seconds)
+
+    def copy(self):
+        # Independent snapshot, e.g. to add one request's stages to the timings of a finished job
+        copied = Timings()
+        with self._lock:
+            copied.stages = list(self.stages)
+            copied.calls = dict(self.calls)
+        return copied
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "stages": {name: seconds for name, seconds in self.stages},
+                "earth_engine": {method: {"calls": count, "seconds": total}
+                                 for method, (count, total) in self.calls.items()},
+            }
+
+    def server_timing(self):
+        # Value of a Server-Timing header (durations in milliseconds)
+        with self._lock:
+            entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages]
+            entries += [f'ee_{method};dur={total * 1000:.1f};desc="{count} calls"'
+                        for method, (count, total) in self.calls.items()]
+        return ", ".join(entries)
+
+
+_current_timings = contextvars.ContextVar("timings", default=None)
+
+
+@contextmanager
+def recording(timings):
+    # Adds the Earth Engine calls made in the current context to `timings`
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+@contextmanager
+def stage(name, timings=None):
+    # Times a block as an analysis stage
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.observe("blockcarbon_stage_seconds", elapsed, stage=name)
+        if timings is not None:
+            timings.add(name, elapsed)
+
+
+def timed_call(method, fn, *args, **kwargs):
+    # Performs one Earth Engine round trip (e.g. timed_call("getInfo", obj.getInfo)) and accounts for it
+    start = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    except Exception:
+        registry.inc("blockcarbon_earth_engine_request_errors_total", method=method)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.inc("blockcarbon_earth_engine_requests_total", method=method)
+        registry.observe("blockcarbon_earth_engine_request_seconds", elapsed, method=method)
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.add_call(method, elapsed)
@@ -0,0 +1,110 @@
+# Vectorized carbon stock projection.
+#
+# All functions broadcast over NumPy arrays so that many parcels, parameter sets and years can be
+# projected in one call. Results are laid out as (parcels, parameter sets, years).
+
+import math
+
+import numpy as np
+
+CARBON_FRACTION = 0.47        # Carbon makes up approximately 47% of the dry biomass for most tree species
+CO2_PER_CARBON = 44 / 12      # Tonnes of CO2 (one carbon credit each) per tonne of carbon
+
+# math.exp applied element-wise (a Python level loop). np.exp may differ from math.exp in the last
+# bit; `exact=True` is only for the scalar functions in app.py, which must keep reproducing their
+# original results exactly.
+_exact_exp = np.frompyfunc(math.exp, 1, 1)
+
+
+def converted_area(areas):
+    # Area (ha) of shrubland, grassland and cropland converted to tree cover; works for scalar or
+    # array valued `areas` dicts
+    return areas["Shrubland"] + areas["Grassland"] + areas["Cropland"]
+
+
+def aboveground_woody_biomass(years, max_biomass, growth_rate, mortality_rate=0.1, exact=False):
+    # Aboveground woody biomass (t/ha) in the project scenario at each year, using a logistic growth
+    # model adjusted for mortality. Inputs broadcast against each other.
+    exponent = np.multiply(-np.asarray(growth_rate, dtype=float), np.asarray(years, dtype=float))
+    growth = np.asarray(_exact_exp(exponent), dtype=float) if exact else np.exp(exponent)
+    biomass = np.multiply(max_biomass, 1 - growth)
+    return biomass * np.subtract(1, mortality_rate)
+
+
+def woody_biomass_carbon_stock(years, max_biomass, growth_rate, mortality_rate, root_to_shoot, exact=False):
+    # Average carbon stock (tC/ha) in above and belowground woody biomass at each year
+    aboveground = aboveground_woody_biomass(years, max_biomass, growth_rate, mortality_rate, exact)
+    aboveground_carbon_stock = aboveground * CARBON_FRACTION
+    return aboveground_carbon_stock * np.add(1, root_to_shoot)
+
+
+def project_carbon(years, converted_areas, baselines, max_biomass=150, growth_rate=0.1,
+                   mortality_rate=0.1, root_to_shoot=0.25, exact=False):
+    # Projects the change in carbon stocks (tC) relative to the baseline and the carbon credits earned.
+    #
+    # `years` is a 1-D array of years, `converted_areas` (ha) and `baselines` (tC) are per parcel and
+    # the four growth parameters are scalars or 1-D arrays of parameter sets. Returns two arrays of
+    # shape (parcels, parameter sets, years). `exact` uses math.exp instead of np.exp (much slower).
+    years = np.atleast_1d(np.asarray(years, dtype=float))
+    converted_areas = np.atleast_1d(np.asarray(converted_areas, dtype=float))
+    baselines = np.broadcast_to(np.asarray(baselines, dtype=float), converted_areas.shape)
+    parameters = np.broadcast_arrays(*[np.atleast_1d(np.asarray(value, dtype=float)) for value in
+                                       (max_biomass, growth_rate, mortality_rate, root_to_shoot)])
+    max_biomass, growth_rate, mortality_rate, root_to_shoot = [value[:, None] for value in parameters]
+
+    # Carbon stock per hectare for every (parameter set, year), then scaled to every parcel
+    stock_per_ha = woody_biomass_carbon_stock(years[None, :], max_biomass, growth_rate,
+                                              mortality_rate, root_to_shoot, exact)
+    total_carbon_stocks = stock_per_ha[None, :, :] * converted_areas[:, None, None]
+    carbon_stock_changes = total_carbon_stocks - baselines[:, None, None]
+    return carbon_stock_changes, carbon_stock_changes * CO2_PER_CARBON
+
+
+def _sample(rng, spec, size):
+    # Draws `size` values from a distribution spec: a number (fixed value) or a tuple of
+    # ("normal", mean, sd), ("lognormal", mean, sigma), ("uniform", low, high) or
+    # ("triangular", left, mode, right)
+    if np.isscalar(spec):
+        return np.full(size, float(spec))
+    name, *args = spec
+    if name == "normal":
+        return rng.normal(*args, size=size)
+    if name == "lognormal":
+        return rng.lognormal(*args, size=size)
+    if name == "uniform":
+        return rng.uniform(*args, size=size)
+    if name == "triangular":
+        return rng.triangular(*args, size=size)
+    raise ValueError(f"Unknown distribution: {name}")
+
+
+def monte_carlo_projection(years, converted_areas, baselines, samples=1000, max_biomass=150,
+                           growth_rate=("normal", 0.1, 0.02), mortality_rate=("uniform", 0.05, 0.15),
+                           root_to_shoot=("normal", 0.25, 0.05), percentiles=(5, 50, 95), seed=None):
+    # Samples the growth parameters and returns percentile bands of the carbon stock changes (tC)
+    # and credits, each of shape (percentiles, parcels, years).
+    #
+    # The parameters are shared by all parcels in a sample, and the change of a parcel is an
+    # increasing affine function (area * stock - baseline) of the per hectare stock. Its percentiles
+    # are therefore taken over the (samples, years) stock matrix alone instead of materializing
+    # every (sample, parcel, year) value.
+    rng = np.random.default_rng(seed)
+    years = np.atleast_1d(np.asarray(years, dtype=float))
+    converted_areas = np.atleast_1d(np.asarray(converted_areas, dtype=float))
+    baselines = np.broadcast_to(np.asarray(baselines, dtype=float), converted_areas.shape)
+
+    max_biomass = np.clip(_sample(rng, max_biomass, samples), 0, None)
+    growth_rate = np.clip(_sample(rng, growth_rate, samples), 0, None)
+    mortality_rate = np.clip(_sample(rng, mortality_rate, samples), 0, 1)
+    root_to_shoot = np.clip(_sample(rng, root_to_shoot, samples), 0, None)
+
+    stock_per_ha = woody_biomass_carbon_stock(years[None, :], max_biomass[:, None], growth_rate[:, None],
+                                              mortality_rate[:, None], root_to_shoot[:, None])
+    stock_bands = np.percentile(stock_per_ha, percentiles, axis=0)
+
+    carbon_stock_changes = stock_bands[:, None, :] * converted_areas[None, :, None] - baselines[None, :, None]
+    return {
+        "percentiles": list(percentiles),
+        "carbon_stock_changes": carbon_stock_changes,
+        "carbon_credits": carbon_stock_changes * CO2_PER_CARBON,
+    }
@@ -0,0 +1,72 @@
+# Rate limiting and retries for Earth Engine requests.
+#
+# Earth Engine enforces per-project request quotas. A shared token bucket keeps bulk work under the
+# configured request rate, and quota errors that still happen are retried with exponential backoff.
+
+import random, threading, time
+
+# Fragments of the error messages Earth Engine returns when a quota or rate limit is hit
+QUOTA_ERROR_MARKERS = ("quota", "rate limit", "too many concurrent", "too many requests", "429")
+# ... and when a request failed for a reason that may go away on its own (server errors, timeouts)
+TRANSIENT_ERROR_MARKERS = ("internal error", "internal server error", "backend error", "service unavailable",
+                           "bad gateway", "gateway timeout", "deadline exceeded", "timed out",
+                           "connection reset", "connection aborted")
+
+
+class TokenBucket:
+    # Allows `rate` acquisitions per second on average with bursts of up to `capacity`
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1, timeout=None):
+        # Blocks until `tokens` are available; returns False if that takes longer than `timeout`
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+def is_quota_error(error):
+    message = str(error).lower()
+    return any(marker in message for marker in QUOTA_ERROR_MARKERS)
+
+
+def is_transient_error(error):
+    # Quota errors, server errors and timeouts; anything else (missing assets, invalid geometries,
+    # bad band names...) fails the same way when retried
+    if isinstance(error, (TimeoutError, ConnectionError)) or is_quota_error(error):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in TRANSIENT_ERROR_MARKERS)
+
+
+def call_with_retries(fn, limiter=None, retries=4, backoff=1.0, max_backoff=30.0, retry_on=is_quota_error):
+    # Calls `fn` after taking a token from `limiter`, retrying errors accepted by `retry_on` with
+    # exponential backoff and full jitter
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= retries or not retry_on(e):
+                raise
+            time.sleep(random.uniform(0, min(max_backoff, backoff * 2 ** attempt)))
+            attempt += 1
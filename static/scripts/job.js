@@ -0,0 +1,66 @@
+document.addEventListener('DOMContentLoaded', () => {
+    const jobElement = document.getElementById('job-status');
+    const message = document.getElementById('job-message');
+    const stageList = document.getElementById('job-stages');
+    const cancelButton = document.getElementById('cancel-button');
+    const loadingIcon = jobElement.querySelector('.loading-icon');
+
+    // Retrieve endpoint URLs from data attributes
+    const statusUrl = jobElement.getAttribute('data-status-url');
+    const resultsUrl = jobElement.getAttribute('data-results-url');
+
+    // Human readable names of the analysis stages
+    const stageNames = {
+        satellite_thumbnail: 'Satellite image',
+        landcover_thumbnail: 'Land cover map',
+        landcover_areas: 'Land cover areas',
+        carbon_projection: 'Carbon projection',
+        ndvi_series: 'Vegetation time series',
+    };
+
+    // Function to show the status of every stage
+    const renderStages = (stages) => {
+        stageList.innerHTML = '';
+        Object.entries(stages).forEach(([name, stage]) => {
+            const item = document.createElement('li');
+            item.className = `job-stage job-stage-${stage.status}`;
+            item.textContent = `${stageNames[name] || name}: ${stage.status.replace('_', ' ')}`;
+            stageList.appendChild(item);
+        });
+    };
+
+    // Function to poll the job until it finishes
+    const poll = async () => {
+        try {
+            const response = await fetch(statusUrl, { headers: { Accept: 'application/json' } });
+            const job = await response.json();
+            if (!response.ok) {
+                throw new Error(job.error || response.statusText);
+            }
+            renderStages(job.stages);
+            message.textContent = `Progress: ${Math.round(job.progress * 100)}%`;
+
+            if (job.status === 'done') {
+                window.location.href = resultsUrl;
+                return;
+            }
+            if (['failed', 'cancelled', 'timed_out'].includes(job.status)) {
+                loadingIcon.style.display = 'none';
+                cancelButton.style.display = 'none';
+                message.textContent = job.error || `Analysis ${job.status.replace('_', ' ')}.`;
+                return;
+            }
+            setTimeout(poll, 1000);
+        } catch (error) {
+            loadingIcon.style.display = 'none';
+            message.textContent = `Could not get the analysis status: ${error.message}`;
+        }
+    };
+
+    cancelButton.addEventListener('click', async () => {
+        cancelButton.disabled = true;
+        await fetch(statusUrl, { method: 'DELETE' });
+    });
+
+    poll();
+});
@@ -1,5 +1,9 @@
 document.addEventListener('DOMContentLoaded', () => {
     const imageElement = document.getElementById('satellite-image');
+    if (!imageElement) {
+        // No imagery (offline land cover backend)
+        return;
+    }
     const prevButton = document.getElementById('prev-button');
     const nextButton = document.getElementById('next-button');
 
@@ -0,0 +1,49 @@
+# Tests run offline against the in-process Earth Engine stand-in (fake_ee) with a memory-only cache.
+
+import os, sys
+
+os.environ.setdefault("BLOCKCARBON_FAKE_EE", "1")
+os.environ.setdefault("BLOCKCARBON_CACHE_PATH", '""')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+import fake_ee
+from localraster import save_tile
+
+# Two side by side synthetic land cover tiles (class 0 is nodata)
+TILE_BOUNDS = [(10.0, 1.0, 10.05, 1.04), (10.05, 1.0, 10.1, 1.04)]
+TILE_SHAPE = (40, 50)
+
+
+@pytest.fixture(autouse=True)
+def fresh_fake_ee():
+    # Every test starts with zeroed round trip counters, no latency and no injected failures
+    fake_ee.reset()
+    yield fake_ee
+    fake_ee.reset()
+
+
+@pytest.fixture
+def raster_tiles(tmp_path):
+    # Saves random class tiles covering TILE_BOUNDS to tmp_path/tiles; returns [(classes, bounds), ...]
+    rng = np.random.default_rng(7)
+    tiles = []
+    for n, bounds in enumerate(TILE_BOUNDS):
+        classes = rng.choice(np.array([0, 10, 20, 30, 40], dtype=np.uint8), size=TILE_SHAPE)
+        save_tile(str(tmp_path / "tiles"), f"tile{n}", classes, bounds)
+        tiles.append((classes, bounds))
+    return tiles
+
+
+@pytest.fixture
+def tile_dir(tmp_path, raster_tiles):
+    return str(tmp_path / "tiles")
+
+
+def assert_areas_match(areas, expected, rel=1e-12):
+    # Same classes with the same areas (m²)
+    assert set(areas) == set(expected)
+    for class_value, area in expected.items():
+        assert areas[class_value] == pytest.approx(area, rel=rel)
@@ -0,0 +1,68 @@
+import json, os
+
+import numpy as np
+import pytest
+
+from areaindex import AreaIndex, IndexedLandcover, build_index
+from conftest import TILE_BOUNDS, TILE_SHAPE, assert_areas_match
+from localraster import LocalRasterLandcover, save_tile
+
+QUERIES = [(10.0, 1.0, 10.1, 1.04), (10.0213, 1.0071, 10.0817, 1.0333), (10.051, 1.002, 10.052, 1.003)]
+
+
+@pytest.mark.parametrize("max_cells", [5e7, 10])
+def test_index_matches_the_raster_scan(tile_dir, tmp_path, max_cells):
+    index_dir = str(tmp_path / "index")
+    build_index(tile_dir, index_dir, levels=(4, 16), max_cells=max_cells)
+    with open(os.path.join(index_dir, "index.json")) as f:
+        blocks = {entry["block"] for entry in json.load(f)["tiles"]}
+    assert blocks == ({4} if max_cells > 10 else {16})
+
+    raster = LocalRasterLandcover(tile_dir)
+    index = AreaIndex(index_dir)
+    for bounds in QUERIES:
+        assert_areas_match(index.class_pixel_areas(bounds), raster.class_pixel_areas(bounds))
+
+
+def test_rebuild_skips_unchanged_tiles_and_removes_superseded_tables(tile_dir, tmp_path):
+    index_dir = str(tmp_path / "index")
+    assert len(build_index(tile_dir, index_dir, levels=(8,))) == 2
+    assert build_index(tile_dir, index_dir, levels=(8,)) == []
+    assert len(build_index(tile_dir, index_dir, levels=(16,))) == 2
+    tables = sorted(name for name in os.listdir(index_dir) if name.endswith(".npy"))
+    assert len(tables) == 2 and all(".b16." in name for name in tables)
+
+
+def test_reader_of_the_old_manifest_recovers_after_a_rebuild(tile_dir, tmp_path):
+    index_dir = str(tmp_path / "index")
+    build_index(tile_dir, index_dir, levels=(8,))
+    stale = AreaIndex(index_dir)
+
+    save_tile(tile_dir, "tile0", np.full(TILE_SHAPE, 50, dtype=np.uint8), TILE_BOUNDS[0])
+    os.utime(os.path.join(tile_dir, "tile0.npy"), (0, 0))
+    build_index(tile_dir, index_dir, levels=(8,))
+
+    bounds = QUERIES[1]
+    assert_areas_match(stale.class_pixel_areas(bounds), LocalRasterLandcover(tile_dir).class_pixel_areas(bounds))
+    assert 50 in stale.class_pixel_areas(bounds)
+
+
+def test_polygons_and_uncovered_boxes_go_to_the_fallback(tile_dir, tmp_path):
+    index_dir = str(tmp_path / "index")
+    build_index(tile_dir, index_dir, levels=(8,))
+    raster = LocalRasterLandcover(tile_dir)
+    asked = []
+
+    class Fallback:
+        dataset, scale = raster.dataset, raster.scale
+
+        def class_pixel_areas(self, region, call=None, progress=None):
+            asked.append(region)
+            return raster.class_pixel_areas(region)
+
+    source = IndexedLandcover(index_dir, Fallback())
+    polygon = {"type": "Polygon", "coordinates": [[[10.01, 1.005], [10.09, 1.01], [10.07, 1.035], [10.01, 1.005]]]}
+    source.class_pixel_areas(QUERIES[0])
+    source.class_pixel_areas(polygon)
+    source.class_pixel_areas((9.99, 1.0, 10.02, 1.01))
+    assert asked == [polygon, (9.99, 1.0, 10.02, 1.01)]
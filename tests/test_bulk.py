@@ -0,0 +1,123 @@
+import json, threading, time
+
+import pytest
+
+import fake_ee as ee
+from bulk import analyze_parcels, iter_features, iter_ndjson_features, parcel_region
+from ratelimit import TokenBucket, call_with_retries
+
+SQUARE = {"type": "Polygon", "coordinates": [[[10.0, 1.0], [10.02, 1.0], [10.02, 1.02], [10.0, 1.02], [10.0, 1.0]]]}
+
+
+def feature(geometry=SQUARE, **extra):
+    return dict({"type": "Feature", "geometry": geometry, "properties": {}}, **extra)
+
+
+def test_parcel_regions():
+    assert parcel_region(feature()) == SQUARE
+    assert parcel_region(feature(None, bbox=[10, 1, 10.02, 1.02])) == (10.0, 1.0, 10.02, 1.02)
+    with pytest.raises(ValueError, match="bbox is empty"):
+        parcel_region(feature(None, bbox=[10.02, 1, 10, 1.02]))
+    with pytest.raises(ValueError, match="neither a geometry nor a bbox"):
+        parcel_region(feature(None))
+    with pytest.raises(ValueError, match="Unsupported geometry type: Point"):
+        parcel_region(feature({"type": "Point", "coordinates": [10.0, 1.0]}))
+
+
+def test_parcels_in_flight_are_bounded_and_records_stream_in_completion_order():
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+    def analyze(region):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.2 if region == (0.0, 0.0, 1.0, 1.0) else 0.01)
+        with lock:
+            running[0] -= 1
+        return {"left": region[0]}
+
+    features = [feature(None, bbox=[n, 0, n + 1, 1], id=f"p{n}") for n in range(12)]
+    records = list(analyze_parcels(iter(features), analyze, concurrency=3))
+    assert peak[0] == 3
+    assert sorted(record["index"] for record in records) == list(range(12))
+    # The slow first parcel does not hold back the others
+    assert records[-1]["index"] == 0
+    assert all(record["id"] == f"p{record['index']}" and record["left"] == record["index"] for record in records)
+
+
+def test_bad_features_and_invalid_lines_become_error_records():
+    lines = [json.dumps(feature(None, bbox=[0, 0, 1, 1], properties={"id": "good"})).encode(), b"",
+             b"{not json", json.dumps(feature({"type": "Point", "coordinates": [0, 0]}))]
+    records = sorted(analyze_parcels(iter_ndjson_features(lines), lambda region: {"ok": True}),
+                     key=lambda record: record["index"])
+    assert records[0] == {"index": 0, "id": "good", "ok": True}
+    assert records[1]["error"].startswith("Invalid JSON")
+    assert records[2]["error"] == "Unsupported geometry type: Point"
+
+    def fail(region):
+        raise ee.EEException("Image.select: Band 'Map' not found.")
+    records = list(analyze_parcels(iter_features({"type": "FeatureCollection", "features": [feature()]}), fail))
+    assert records == [{"index": 0, "id": 0, "error": "Image.select: Band 'Map' not found."}]
+
+
+def test_token_bucket_rate_and_timeout():
+    bucket = TokenBucket(rate=20, capacity=2)
+    start = time.monotonic()
+    for _ in range(6):
+        assert bucket.acquire()
+    # Two tokens of burst, then four more at 20 per second
+    assert time.monotonic() - start == pytest.approx(0.2, abs=0.08)
+
+    bucket = TokenBucket(rate=1, capacity=1)
+    assert bucket.acquire(timeout=0)
+    start = time.monotonic()
+    assert not bucket.acquire(timeout=0.1)
+    assert time.monotonic() - start < 0.05
+
+
+def test_retries_back_off_on_quota_errors_only(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr("ratelimit.time.sleep", sleeps.append)
+    attempts = []
+    def quota_then_ok():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ee.EEException("Too many concurrent aggregations.")
+        return "ok"
+    assert call_with_retries(quota_then_ok, retries=4, backoff=1.0) == "ok"
+    assert len(attempts) == 3
+    assert len(sleeps) == 2 and 0 <= sleeps[0] <= 1.0 and 0 <= sleeps[1] <= 2.0
+
+    attempts.clear()
+    def permanent():
+        attempts.append(1)
+        raise ee.EEException("Geometry is invalid.")
+    with pytest.raises(ee.EEException, match="invalid"):
+        call_with_retries(permanent, retries=4)
+    assert len(attempts) == 1 and len(sleeps) == 2
+
+    attempts.clear()
+    def always_quota():
+        attempts.append(1)
+        raise ee.EEException("Quota exceeded.")
+    with pytest.raises(ee.EEException, match="Quota"):
+        call_with_retries(always_quota, retries=2)
+    assert len(attempts) == 3
+
+
+def test_bulk_endpoint_streams_ndjson():
+    import app as blockcarbon
+    blockcarbon.result_cache.invalidate()
+    body = "\n".join([json.dumps(feature(properties={"id": "polygon"})),
+                      json.dumps(feature(None, bbox=[10.0, 1.0, 10.03, 1.02], id="box")),
+                      "{not json"]) + "\n"
+    response = blockcarbon.app.test_client().post('/bulk', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    records = {record["index"]: record for record in map(json.loads, response.get_data(as_text=True).splitlines())}
+    assert records[0]["id"] == "polygon" and records[1]["id"] == "box"
+    assert records[0]["landcover_areas"]["Tree Cover"] > 0
+    assert len(records[1]["carbon_stock_changes"]) == 10
+    assert "error" in records[2]
+    assert ee.calls["getInfo"] == 2
@@ -0,0 +1,39 @@
+from cache import ResultCache
+
+
+def test_hits_memory_then_disk_after_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    calls = []
+    compute = lambda: calls.append(1) or {"Tree Cover": 1.5}
+
+    cache = ResultCache(path)
+    bounds = cache.snap((10.00001, 1.00002, 10.03, 1.02))
+    assert cache.get_or_compute("landcover_areas", bounds, ["ds"], {"scale": 30}, compute) == {"Tree Cover": 1.5}
+    assert cache.get_or_compute("landcover_areas", bounds, ["ds"], {"scale": 30}, compute) == {"Tree Cover": 1.5}
+    assert len(calls) == 1
+
+    restarted = ResultCache(path)
+    assert restarted.get_or_compute("landcover_areas", bounds, ["ds"], {"scale": 30}, compute) == {"Tree Cover": 1.5}
+    assert len(calls) == 1
+    assert restarted.summary()["stages"]["landcover_areas"]["disk_hits"] == 1
+
+    # Different parameters are a different entry
+    restarted.get_or_compute("landcover_areas", bounds, ["ds"], {"scale": 10}, compute)
+    assert len(calls) == 2
+
+
+def test_invalidate_stage_in_memory_only_mode():
+    cache = ResultCache(None)
+    cache.set("ndvi_series", cache.key("ndvi_series", (0, 0, 1, 1), [], {}), {"2020": 1})
+    assert cache.invalidate(stage="ndvi_series") == 1
+    assert cache.get("ndvi_series", cache.key("ndvi_series", (0, 0, 1, 1), [], {})) == (False, None)
+
+
+def test_admin_endpoints_need_a_token(monkeypatch):
+    import app as blockcarbon
+    client = blockcarbon.app.test_client()
+    assert client.delete('/admin/cache').status_code == 403
+
+    monkeypatch.setitem(blockcarbon.app.config, "ADMIN_TOKEN", "secret")
+    assert client.get('/admin/cache').status_code == 403
+    assert client.get('/admin/cache', headers={"Authorization": "Bearer secret"}).status_code == 200
@@ -0,0 +1,116 @@
+import threading, time
+
+import pytest
+
+from jobs import CANCELLED, DONE, FAILED, TIMED_OUT, JobManager, Stage
+
+
+@pytest.fixture
+def manager():
+    manager = JobManager(max_workers=2, timeout=30)
+    yield manager
+    manager.shutdown()
+
+
+def test_stages_run_after_their_requirements(manager):
+    job = manager.submit([
+        Stage("a", lambda results, progress: 1),
+        Stage("b", lambda results, progress: results["a"] + 1, requires=["a"]),
+        Stage("c", lambda results, progress: results["b"] * 10, requires=["b"]),
+    ])
+    assert job.wait(5)
+    assert job.status == DONE
+    assert job.results == {"a": 1, "b": 2, "c": 20}
+    assert job.progress() == 1.0
+
+
+def test_failed_stage_fails_the_job(manager):
+    def fail(results, progress):
+        raise ValueError("bad band")
+    job = manager.submit([Stage("a", fail), Stage("b", lambda results, progress: 1, requires=["a"])])
+    assert job.wait(5)
+    assert job.status == FAILED
+    assert "bad band" in job.error
+    assert job.stage_status["b"]["status"] == CANCELLED
+
+
+def test_cancelled_stage_stops_at_its_next_progress_report(manager):
+    steps = []
+    def slow(results, progress):
+        for step in range(100):
+            progress(step / 100)
+            steps.append(step)
+            time.sleep(0.01)
+    job = manager.submit([Stage("slow", slow)])
+    time.sleep(0.1)
+    manager.cancel(job.id)
+    time.sleep(0.1)
+    count = len(steps)
+    time.sleep(0.1)
+    assert job.status == CANCELLED
+    assert len(steps) == count < 100
+
+    # The worker is free again for the next job
+    assert manager.submit([Stage("quick", lambda results, progress: 1)]).wait(1)
+
+
+def test_time_in_the_queue_does_not_count_against_the_timeout():
+    manager = JobManager(max_workers=1, timeout=0.5)
+    try:
+        jobs = [manager.submit([Stage("s", lambda results, progress: time.sleep(0.3))]) for _ in range(4)]
+        for job in jobs:
+            assert job.wait(5)
+        assert [job.status for job in jobs] == [DONE] * 4
+        assert all(job.started_at >= job.created_at for job in jobs)
+        assert all(job.to_dict()["deadline"] == job.started_at + 0.5 for job in jobs)
+    finally:
+        manager.shutdown()
+
+
+def test_timeout_stops_a_running_stage():
+    manager = JobManager(max_workers=1, timeout=0.2)
+    stopped = threading.Event()
+    def endless(results, progress):
+        try:
+            while True:
+                progress(0.5)
+                time.sleep(0.01)
+        finally:
+            stopped.set()
+    try:
+        job = manager.submit([Stage("endless", endless)])
+        assert job.wait(5)
+        assert job.status == TIMED_OUT
+        assert stopped.wait(1)
+    finally:
+        manager.shutdown()
+
+
+def test_analysis_job_end_to_end_on_fake_earth_engine(fresh_fake_ee):
+    import app as blockcarbon
+    blockcarbon.result_cache.invalidate()
+    job = blockcarbon.job_manager.submit(blockcarbon.analysis_stages((10.0, 1.0, 10.03, 1.02)))
+    assert job.wait(60)
+    assert job.status == DONE, job.error
+    assert job.results["satellite_thumbnail"].startswith("https://")
+    assert job.results["landcover_areas"]["Tree Cover"] > 0
+    assert len(job.results["carbon_projection"]["carbon_stock_changes"]) == 10
+    assert sorted(job.results["ndvi_series"]) == list(range(2013, 2024))
+    # Two thumbnails, one grouped land cover reduction and one NDVI series
+    assert fresh_fake_ee.calls["getThumbURL"] == 2
+    assert fresh_fake_ee.calls["getInfo"] == 2
+
+
+def test_cancelling_an_analysis_stops_its_tiles(fresh_fake_ee, monkeypatch):
+    import app as blockcarbon
+    blockcarbon.result_cache.invalidate()
+    monkeypatch.setattr(blockcarbon.tile_planner, "max_pixels", 2000)
+    fresh_fake_ee.configure(latency=0.05)
+    job = blockcarbon.job_manager.submit(blockcarbon.analysis_stages((10.0, 1.0, 10.13, 1.09)))
+    time.sleep(0.3)
+    blockcarbon.job_manager.cancel(job.id)
+    time.sleep(0.3)
+    calls = sum(fresh_fake_ee.calls.values())
+    time.sleep(0.3)
+    assert job.status == CANCELLED
+    assert sum(fresh_fake_ee.calls.values()) == calls
@@ -0,0 +1,42 @@
+import pytest
+
+import fake_ee as ee
+from landcover import WORLDCOVER_DATASET, EarthEngineLandcover, landcover_areas, region_bounds
+
+BOUNDS = (10.0, 1.0, 10.03, 1.02)
+CLASSES = {10: {"name": "Tree Cover"}, 20: {"name": "Shrubland"}, 30: {"name": "Grassland"},
+           95: {"name": "Mangroves"}}
+
+
+def per_class_area(region, class_value):
+    # The original one reduction per class approach
+    landcover = ee.Image(WORLDCOVER_DATASET).select("Map")
+    area = ee.Image.pixelArea().updateMask(landcover.eq(class_value)).reduceRegion(
+        reducer=ee.Reducer.sum(), geometry=ee.Geometry.Rectangle(list(region)), scale=30, maxPixels=1e9)
+    return area.getInfo().get("area") or 0
+
+
+def test_grouped_reduction_is_one_round_trip():
+    areas = EarthEngineLandcover(ee).class_pixel_areas(BOUNDS)
+    assert ee.calls["getInfo"] == 1
+    assert set(areas) <= {10, 20, 30, 40, 50, 60, 70, 80, 90}
+
+
+def test_grouped_reduction_matches_per_class_reductions():
+    areas = EarthEngineLandcover(ee).class_pixel_areas(BOUNDS)
+    for class_value in (10, 20, 30, 40, 50, 60, 80, 90):
+        assert areas.get(class_value, 0) == pytest.approx(per_class_area(BOUNDS, class_value), rel=1e-12)
+
+
+def test_landcover_areas_in_hectares_with_missing_classes_zero():
+    class_areas = EarthEngineLandcover(ee).class_pixel_areas(BOUNDS)
+    areas = landcover_areas(EarthEngineLandcover(ee), BOUNDS, CLASSES)
+    assert areas["Tree Cover"] == pytest.approx(class_areas[10] / 10000)
+    assert areas["Mangroves"] == 0
+    assert set(areas) == {"Tree Cover", "Shrubland", "Grassland", "Mangroves"}
+
+
+def test_region_bounds_of_polygon():
+    polygon = {"type": "Polygon", "coordinates": [[[10, 1], [10.2, 1.1], [10.1, 1.3], [10, 1]]]}
+    assert region_bounds(polygon) == (10, 1, 10.2, 1.3)
+    assert region_bounds(BOUNDS) == BOUNDS
@@ -0,0 +1,65 @@
+import math
+
+from conftest import assert_areas_match
+from localraster import EARTH_RADIUS, LocalRasterLandcover
+
+
+def point_in_ring(x, y, ring):
+    inside = False
+    for (x1, y1), (x2, y2) in zip(ring[:-1], ring[1:]):
+        if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+    return inside
+
+
+def brute_force_areas(tiles, bounds, polygon=None, nodata=0):
+    # Per-pixel reference: every pixel whose centre is inside the AOI adds its spherical area
+    left, bottom, right, top = bounds
+    totals = {}
+    for classes, (tile_left, tile_bottom, tile_right, tile_top) in tiles:
+        rows, cols = classes.shape
+        dx, dy = (tile_right - tile_left) / cols, (tile_top - tile_bottom) / rows
+        for row in range(rows):
+            y = tile_top - (row + 0.5) * dy
+            area = EARTH_RADIUS ** 2 * math.radians(dx) * (math.sin(math.radians(tile_top - row * dy))
+                                                           - math.sin(math.radians(tile_top - (row + 1) * dy)))
+            for col in range(cols):
+                x = tile_left + (col + 0.5) * dx
+                if not (left <= x < right and bottom <= y < top) or classes[row, col] == nodata:
+                    continue
+                if polygon is not None and sum(point_in_ring(x, y, ring) for ring in polygon["coordinates"]) % 2 == 0:
+                    continue
+                totals[int(classes[row, col])] = totals.get(int(classes[row, col]), 0) + area
+    return totals
+
+
+def test_rectangle_across_the_tile_seam(tile_dir, raster_tiles):
+    bounds = (10.0213, 1.0071, 10.0817, 1.0333)
+    areas = LocalRasterLandcover(tile_dir).class_pixel_areas(bounds)
+    assert_areas_match(areas, brute_force_areas(raster_tiles, bounds))
+
+
+def test_polygon_with_a_hole(tile_dir, raster_tiles):
+    polygon = {"type": "Polygon", "coordinates": [
+        [[10.01, 1.005], [10.09, 1.01], [10.07, 1.035], [10.02, 1.03], [10.01, 1.005]],
+        [[10.04, 1.015], [10.06, 1.015], [10.06, 1.025], [10.04, 1.025], [10.04, 1.015]],
+    ]}
+    areas = LocalRasterLandcover(tile_dir).class_pixel_areas(polygon)
+    expected = brute_force_areas(raster_tiles, (10.01, 1.005, 10.09, 1.035), polygon)
+    assert_areas_match(areas, expected)
+
+    without_hole = dict(polygon, coordinates=polygon["coordinates"][:1])
+    assert sum(LocalRasterLandcover(tile_dir).class_pixel_areas(without_hole).values()) > sum(areas.values())
+
+
+def test_nodata_pixels_are_ignored(tile_dir, raster_tiles):
+    bounds = (10.0, 1.0, 10.1, 1.04)
+    assert 0 not in LocalRasterLandcover(tile_dir).class_pixel_areas(bounds)
+    areas = LocalRasterLandcover(tile_dir, nodata=40).class_pixel_areas(bounds)
+    assert_areas_match(areas, brute_force_areas(raster_tiles, bounds, nodata=40))
+
+
+def test_progress_is_reported_per_tile(tile_dir):
+    reports = []
+    LocalRasterLandcover(tile_dir).class_pixel_areas((10.0, 1.0, 10.1, 1.04), progress=reports.append)
+    assert reports == [0.0, 0.5]
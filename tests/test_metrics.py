@@ -0,0 +1,94 @@
+import contextvars, re
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import fake_ee as ee
+from metrics import Metrics, Timings, recording, registry, timed_call
+
+
+def samples(text, name):
+    # {labels: value} of the samples of one metric in Prometheus text format
+    return {labels: float(value) for labels, value in re.findall(rf"^{name}(\{{.*\}})? (\S+)$", text, re.M)}
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = Metrics()
+    metrics.histogram("latency_seconds", "Latency.", ["endpoint"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0, 3.0):
+        metrics.observe("latency_seconds", value, endpoint="/")
+    text = metrics.render()
+    assert "# TYPE latency_seconds histogram" in text
+    assert samples(text, "latency_seconds_bucket") == {
+        '{endpoint="/",le="0.1"}': 2, '{endpoint="/",le="1.0"}': 3, '{endpoint="/",le="+Inf"}': 5}
+    assert samples(text, "latency_seconds_count") == {'{endpoint="/"}': 5}
+    assert samples(text, "latency_seconds_sum") == {'{endpoint="/"}': pytest.approx(5.65)}
+
+
+def test_label_values_are_escaped():
+    metrics = Metrics()
+    metrics.counter("errors_total", "Errors.", ["message"])
+    metrics.inc("errors_total", message='bad "band"\\n\nsecond line')
+    assert 'errors_total{message="bad \\"band\\"\\\\n\\nsecond line"} 1' in metrics.render()
+
+
+def test_timed_call_counts_calls_and_errors():
+    before = samples(registry.render(), "blockcarbon_earth_engine_requests_total").get('{method="testCall"}', 0)
+    errors = samples(registry.render(), "blockcarbon_earth_engine_request_errors_total").get('{method="testCall"}', 0)
+    assert timed_call("testCall", lambda x: x * 2, 21) == 42
+    with pytest.raises(ee.EEException):
+        timed_call("testCall", lambda: (_ for _ in ()).throw(ee.EEException("Internal error.")))
+    text = registry.render()
+    assert samples(text, "blockcarbon_earth_engine_requests_total")['{method="testCall"}'] == before + 2
+    assert samples(text, "blockcarbon_earth_engine_request_errors_total")['{method="testCall"}'] == errors + 1
+
+
+def test_calls_reach_the_current_timings_across_copied_contexts():
+    timings = Timings()
+    with recording(timings), ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, timed_call, "getInfo", lambda: None)
+                   for _ in range(8)]
+        [future.result() for future in futures]
+    # Without a copied context the worker thread does not see the recording
+    with recording(Timings()), ThreadPoolExecutor(1) as executor:
+        executor.submit(timed_call, "getInfo", lambda: None).result()
+    assert timings.to_dict()["earth_engine"]["getInfo"]["calls"] == 8
+
+
+@pytest.fixture
+def client():
+    import app as blockcarbon
+    blockcarbon.result_cache.invalidate()
+    return blockcarbon.app.test_client()
+
+
+def run_job(client):
+    import app as blockcarbon
+    response = client.post('/jobs', json={"top_left_latitude": 1.02, "top_left_longitude": 10.0,
+                                          "bottom_right_latitude": 1.0, "bottom_right_longitude": 10.03})
+    job = blockcarbon.job_manager.get(response.get_json()["job_id"])
+    assert job.wait(60)
+    return job
+
+
+def test_server_timing_header_only_when_enabled(client, monkeypatch):
+    import app as blockcarbon
+    job = run_job(client)
+    assert "Server-Timing" not in client.get(f'/jobs/{job.id}/results').headers
+
+    monkeypatch.setitem(blockcarbon.app.config, "SERVER_TIMING", True)
+    header = client.get(f'/jobs/{job.id}/results').headers["Server-Timing"]
+    assert "landcover_areas;dur=" in header and 'ee_getInfo;dur=' in header
+    assert "job;dur=" in header and "render;dur=" in header
+    assert "total;dur=" not in header
+
+
+def test_viewing_results_does_not_change_the_job_timings(client, monkeypatch):
+    import app as blockcarbon
+    monkeypatch.setitem(blockcarbon.app.config, "SERVER_TIMING", True)
+    job = run_job(client)
+    before = client.get(f'/jobs/{job.id}').get_json()["timings"]
+    for _ in range(3):
+        assert client.get(f'/jobs/{job.id}/results').headers["Server-Timing"].count("render;dur=") == 1
+    assert client.get(f'/jobs/{job.id}').get_json()["timings"] == before
+    assert "render" not in before["stages"]
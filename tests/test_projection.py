@@ -0,0 +1,75 @@
+import math, random
+
+import numpy as np
+import pytest
+
+import app as blockcarbon
+from projection import monte_carlo_projection, project_carbon
+
+
+# The scalar formulas the vectorized projection replaced
+def original_biomass(t, max_biomass, growth_rate, mortality_rate=0.1):
+    biomass = max_biomass * (1 - math.exp(-growth_rate * t))
+    return biomass * (1 - mortality_rate)
+
+
+def original_stock_change(t, max_biomass, growth_rate, mortality_rate, root_to_shoot, areas, baseline):
+    aboveground = original_biomass(t, max_biomass, growth_rate, mortality_rate) * 0.47
+    woody = aboveground * (1 + root_to_shoot)
+    converted_area = areas["Shrubland"] + areas["Grassland"] + areas["Cropland"]
+    return woody * converted_area - baseline
+
+
+def random_case(rng):
+    areas = {"Shrubland": rng.uniform(0, 1e4), "Grassland": rng.uniform(0, 1e4), "Cropland": rng.uniform(0, 1e4)}
+    return (rng.randint(0, 50), rng.uniform(1, 400), rng.uniform(0.001, 1), rng.uniform(0, 0.5),
+            rng.uniform(0, 1), areas, rng.uniform(0, 1e6))
+
+
+def test_scalar_wrappers_are_bit_for_bit():
+    rng = random.Random(0)
+    for _ in range(2000):
+        t, max_biomass, growth_rate, mortality_rate, root_to_shoot, areas, baseline = random_case(rng)
+        assert blockcarbon.calculate_aboveground_woody_biomass(t, max_biomass, growth_rate, mortality_rate) \
+            == original_biomass(t, max_biomass, growth_rate, mortality_rate)
+        assert blockcarbon.carbon_stock_change(t, max_biomass, growth_rate, mortality_rate, root_to_shoot,
+                                               areas, baseline) \
+            == original_stock_change(t, max_biomass, growth_rate, mortality_rate, root_to_shoot, areas, baseline)
+
+
+def test_projection_grid_matches_scalar_loop():
+    years = range(1, 11)
+    parcels = [{"Shrubland": 10.0, "Grassland": 5.0, "Cropland": 2.5}, {"Shrubland": 0, "Grassland": 80.0, "Cropland": 1.0}]
+    converted = [sum(parcel.values()) for parcel in parcels]
+    baselines = [120.0, 330.0]
+    growth_rates = [0.05, 0.1, 0.2]
+    changes, credits = project_carbon(years, converted, baselines, 150, growth_rates, 0.1, 0.25)
+    exact, _ = project_carbon(years, converted, baselines, 150, growth_rates, 0.1, 0.25, exact=True)
+
+    assert changes.shape == exact.shape == (2, 3, 10)
+    for n, parcel in enumerate(parcels):
+        for k, growth_rate in enumerate(growth_rates):
+            for y, t in enumerate(years):
+                expected = original_stock_change(t, 150, growth_rate, 0.1, 0.25, parcel, baselines[n])
+                assert exact[n, k, y] == expected
+                assert changes[n, k, y] == pytest.approx(expected, rel=1e-12)
+    np.testing.assert_allclose(credits, changes * 44 / 12)
+
+
+def test_monte_carlo_bands_are_ordered_and_reproducible():
+    kwargs = dict(samples=500, growth_rate=("lognormal", -2.3, 0.3), max_biomass=("normal", 150, 20), seed=42)
+    result = monte_carlo_projection(range(1, 11), [25.0], [100.0], **kwargs)
+    bands = np.asarray(result["carbon_stock_changes"])
+    assert bands.shape == (3, 1, 10)
+    assert np.all(bands[0] <= bands[1]) and np.all(bands[1] <= bands[2])
+    again = monte_carlo_projection(range(1, 11), [25.0], [100.0], **kwargs)
+    np.testing.assert_array_equal(bands, np.asarray(again["carbon_stock_changes"]))
+
+
+def test_fixed_parameters_collapse_the_bands():
+    result = monte_carlo_projection(range(1, 6), [10.0], [50.0], samples=50, growth_rate=0.1,
+                                    mortality_rate=0.1, root_to_shoot=0.25, seed=1)
+    bands = np.asarray(result["carbon_stock_changes"])
+    expected, _ = project_carbon(range(1, 6), [10.0], [50.0], 150, 0.1, 0.1, 0.25)
+    for band in bands:
+        np.testing.assert_allclose(band, expected[:, 0], rtol=1e-12)
@@ -0,0 +1,158 @@
+import itertools, random
+
+import pytest
+
+import fake_ee as ee
+from landcover import EarthEngineLandcover
+from tiling import TilePlanner, merge_sums, pixel_count, plan_tiles
+from timeseries import ndvi_time_series
+
+BOUNDS = (10.0, 1.0, 10.13, 1.09)
+POLYGON = {"type": "Polygon", "coordinates": [[[10.0, 1.0], [10.13, 1.02], [10.1, 1.09], [10.02, 1.07], [10.0, 1.0]]]}
+
+
+def assert_sums_match(tiled, untiled):
+    assert set(tiled) == set(untiled)
+    for key, value in untiled.items():
+        assert tiled[key] == pytest.approx(value, rel=1e-12)
+
+
+def test_plan_partitions_the_region():
+    assert plan_tiles(BOUNDS, 30, 1e9) == [BOUNDS]
+    tiles = plan_tiles(BOUNDS, 30, 20000)
+    assert len(tiles) > 1
+    assert all(pixel_count(tile, 30) <= 20000 for tile in tiles)
+    assert min(tile[0] for tile in tiles) == BOUNDS[0] and max(tile[2] for tile in tiles) == BOUNDS[2]
+    assert min(tile[1] for tile in tiles) == BOUNDS[1] and max(tile[3] for tile in tiles) == BOUNDS[3]
+    area = sum((right - left) * (top - bottom) for left, bottom, right, top in tiles)
+    assert area == pytest.approx((BOUNDS[2] - BOUNDS[0]) * (BOUNDS[3] - BOUNDS[1]), rel=1e-12)
+
+
+@pytest.mark.parametrize("region", [BOUNDS, POLYGON])
+def test_tiled_reduction_matches_untiled(region):
+    untiled = EarthEngineLandcover(ee).class_pixel_areas(region)
+    ee.reset()
+    tiled = EarthEngineLandcover(ee, tiling=TilePlanner(max_pixels=20000)).class_pixel_areas(region)
+    assert ee.calls["getInfo"] > 1
+    assert_sums_match(tiled, untiled)
+
+
+def test_tiles_over_the_pixel_limit_are_split():
+    untiled = EarthEngineLandcover(ee).class_pixel_areas(BOUNDS)
+    ee.reset()
+    source = EarthEngineLandcover(ee, max_pixels=20000, tiling=TilePlanner(max_pixels=1e9, max_splits=4))
+    assert_sums_match(source.class_pixel_areas(BOUNDS), untiled)
+    assert ee.calls["getInfo"] > 1
+
+
+def failing(message, times):
+    failures = itertools.count()
+    def fail(kind):
+        if kind == "getInfo" and next(failures) < times:
+            raise ee.EEException(message)
+    return fail
+
+
+def test_only_transient_errors_are_retried():
+    planner = TilePlanner(max_pixels=1e9, retries=2, backoff=0)
+    ee.configure(fail=failing("Internal error.", 2))
+    assert EarthEngineLandcover(ee, tiling=planner).class_pixel_areas(BOUNDS)
+    assert ee.calls["getInfo"] == 3
+
+    ee.reset()
+    ee.configure(fail=failing("Image.select: Band 'Map' not found.", 1))
+    with pytest.raises(ee.EEException, match="not found"):
+        EarthEngineLandcover(ee, tiling=planner).class_pixel_areas(BOUNDS)
+    assert ee.calls["getInfo"] == 1
+
+
+def test_call_wrapper_performs_every_round_trip():
+    wrapped = []
+    def call(fn):
+        wrapped.append(1)
+        return fn()
+    EarthEngineLandcover(ee, tiling=TilePlanner(max_pixels=20000)).class_pixel_areas(BOUNDS, call=call)
+    assert len(wrapped) == ee.calls["getInfo"] > 1
+
+
+def test_progress_is_reported_and_can_stop_the_tiles():
+    reports = []
+    source = EarthEngineLandcover(ee, tiling=TilePlanner(max_pixels=2000, concurrency=2))
+    source.class_pixel_areas(BOUNDS, progress=reports.append)
+    assert reports[0] == 0.0 and reports[-1] == 1.0
+    assert reports == sorted(reports)
+    total = ee.calls["getInfo"]
+
+    ee.reset()
+    def stop(fraction):
+        if fraction > 0.1:
+            raise RuntimeError("cancelled")
+    with pytest.raises(RuntimeError, match="cancelled"):
+        source.class_pixel_areas(BOUNDS, progress=stop)
+    assert ee.calls["getInfo"] < total
+
+
+def test_tiled_ndvi_series_matches_untiled():
+    bounds = (10.0, 1.0, 10.06, 1.04)
+    untiled = ndvi_time_series(ee, bounds, 2015, 2017)
+    tiled = ndvi_time_series(ee, bounds, 2015, 2017, tiling=TilePlanner(max_pixels=20000))
+    assert_sums_match(tiled, untiled)
+
+
+def test_merge_does_not_depend_on_the_tile_order():
+    rng = random.Random(3)
+    parts = [{key: rng.uniform(0, 1e6) * 10 ** rng.randint(-8, 8) for key in rng.sample(range(10), 6)}
+             for _ in range(50)]
+    merged = merge_sums(parts)
+    for _ in range(5):
+        rng.shuffle(parts)
+        assert merge_sums(parts) == merged
+
+
+def recording_reducer(source, reductions):
+    # Reduces one tile with `source`, remembering every (tile, scale, sums)
+    def reduce_tile(tile, scale):
+        sums = source._reduce(ee.Geometry.Rectangle(list(tile)), None, scale)
+        reductions.append((tile, scale, sums))
+        return sums
+    return reduce_tile
+
+
+def test_adaptive_scale_stays_within_the_error_budget():
+    reductions = []
+    planner = TilePlanner(max_pixels=20000, error_budget=0.05)
+    scale = planner.choose_scale(BOUNDS, 30, recording_reducer(EarthEngineLandcover(ee), reductions))
+    assert scale > 30
+
+    # The pilot is reduced at the base scale and then at doubling scales
+    pilot, base_scale, reference = reductions[0]
+    assert base_scale == 30 and all(tile == pilot for tile, _, _ in reductions)
+    coarse = next(sums for _, reduced_scale, sums in reductions if reduced_scale == scale)
+    error = sum(abs(coarse.get(key, 0) - reference.get(key, 0)) for key in set(coarse) | set(reference))
+    assert error / sum(reference.values()) <= 0.05
+
+
+@pytest.mark.parametrize("error_budget, max_pixels", [(0, 20000), (None, 20000), (0.05, 1e9)])
+def test_base_scale_without_budget_or_when_the_region_fits(error_budget, max_pixels):
+    reductions = []
+    planner = TilePlanner(max_pixels=max_pixels, error_budget=error_budget)
+    assert planner.choose_scale(BOUNDS, 30, recording_reducer(EarthEngineLandcover(ee), reductions)) == 30
+    assert reductions == []
+
+
+def test_pilot_reductions_go_through_the_call_wrapper():
+    wrapped = []
+    def call(fn):
+        wrapped.append(1)
+        return fn()
+    planner = TilePlanner(max_pixels=20000, error_budget=0.05)
+    areas = EarthEngineLandcover(ee, tiling=planner).class_pixel_areas(BOUNDS, call=call)
+    assert len(wrapped) == ee.calls["getInfo"]
+
+    # Every pilot reduction plus one per tile at the chosen scale
+    pilots = []
+    scale = planner.choose_scale(BOUNDS, 30, recording_reducer(EarthEngineLandcover(ee), pilots))
+    assert len(pilots) >= 2
+    assert len(wrapped) == len(pilots) + len(planner.plan(BOUNDS, scale))
+    untiled = EarthEngineLandcover(ee).class_pixel_areas(BOUNDS)
+    assert sum(areas.values()) == pytest.approx(sum(untiled.values()), rel=0.05)
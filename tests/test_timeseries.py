@@ -0,0 +1,35 @@
+import pytest
+
+import fake_ee as ee
+from timeseries import ndvi_time_series
+
+BOUNDS = (10.0, 1.0, 10.03, 1.02)
+
+
+def test_series_is_one_round_trip():
+    series = ndvi_time_series(ee, BOUNDS, 2013, 2023)
+    assert ee.calls["getInfo"] == 1
+    assert list(series) == list(range(2013, 2024))
+    assert all(area > 0 for area in series.values())
+
+
+def test_higher_threshold_means_less_vegetation():
+    low = ndvi_time_series(ee, BOUNDS, 2015, 2016, ndvi_threshold=0.1)
+    high = ndvi_time_series(ee, BOUNDS, 2015, 2016, ndvi_threshold=0.6)
+    assert all(high[year] < low[year] for year in low)
+
+
+@pytest.fixture
+def client():
+    import app as blockcarbon
+    blockcarbon.result_cache.invalidate()
+    return blockcarbon.app.test_client()
+
+
+def test_endpoint_rejects_years_outside_landsat7(client):
+    data = {"top_left_latitude": 1.02, "top_left_longitude": 10.0,
+            "bottom_right_latitude": 1.0, "bottom_right_longitude": 10.03}
+    assert client.post('/ndvi_time_series', json=dict(data, start_year=1, end_year=1000000)).status_code == 400
+    response = client.post('/ndvi_time_series', json=dict(data, start_year=2020, end_year=2021))
+    assert response.status_code == 200
+    assert set(response.get_json()["vegetated_ha"]) == {"2020", "2021"}
@@ -0,0 +1,159 @@
+# Tiling of large AOIs into sub-rectangles for Earth Engine reductions.
+#
+# A reduction over an AOI that is too large for one reduceRegion call is split into a grid of tiles
+# whose edges lie on pixel boundaries, so every pixel centre belongs to exactly one tile and the
+# per-key sums (class areas, yearly vegetated areas) of the tiles add up to the sum over the AOI.
+# Tiles are reduced in parallel with bounded concurrency, tiles failing with transient errors are
+# retried (or every round trip goes through a caller supplied `call` wrapper, e.g. rate limiting
+# with quota backoff) and tiles that still exceed the pixel limit are split further. Optionally the
+# scale is coarsened as long as the error measured on a pilot tile stays within a budget.
+
+import contextvars, math
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from ratelimit import call_with_retries, is_transient_error
+
+METERS_PER_DEGREE = 111319.49     # Length of one degree of latitude (m)
+
+
+def pixel_step(scale):
+    # Size (degrees) of a `scale` meter pixel in the EPSG:4326 grid used for the reductions
+    return scale / METERS_PER_DEGREE
+
+
+def pixel_count(bounds, scale):
+    left, bottom, right, top = bounds
+    step = pixel_step(scale)
+    return math.ceil((right - left) / step) * math.ceil((top - bottom) / step)
+
+
+def plan_tiles(bounds, scale, max_pixels):
+    # Splits (left, bottom, right, top) into a grid of tiles of at most `max_pixels` pixels each.
+    # Inner tile edges are snapped to pixel edges; the outer edges are the AOI's own.
+    left, bottom, right, top = bounds
+    if pixel_count(bounds, scale) <= max_pixels:
+        return [tuple(bounds)]
+
+    step = pixel_step(scale)
+    side = max(int(math.sqrt(max_pixels)) - 1, 1)
+    columns = math.ceil((right - left) / step / side)
+    rows = math.ceil((top - bottom) / step / side)
+
+    def edges(start, stop, count):
+        inner = [round((start + (stop - start) * i / count) / step) * step for i in range(1, count)]
+        return [start] + [edge for edge in inner if start < edge < stop] + [stop]
+
+    x_edges = edges(left, right, columns)
+    y_edges = edges(bottom, top, rows)
+    return [(x0, y0, x1, y1) for y0, y1 in zip(y_edges[:-1], y_edges[1:]) for x0, x1 in zip(x_edges[:-1], x_edges[1:])]
+
+
+def split_tile(bounds):
+    # Quarters a tile (used when a tile still hits the pixel limit)
+    left, bottom, right, top = bounds
+    middle_x, middle_y = (left + right) / 2, (bottom + top) / 2
+    return [(left, bottom, middle_x, middle_y), (middle_x, bottom, right, middle_y),
+            (left, middle_y, middle_x, top), (middle_x, middle_y, right, top)]
+
+
+def merge_sums(parts):
+    # Adds up {key: value} dicts with math.fsum so the merge does not depend on the tile order
+    values = {}
+    for part in parts:
+        for key, value in part.items():
+            values.setdefault(key, []).append(value or 0)
+    return {key: math.fsum(items) for key, items in values.items()}
+
+
+def is_pixel_limit_error(error):
+    return "too many pixels" in str(error).lower()
+
+
+class TilePlanner:
+    # `max_pixels` caps the pixels per reduction, `concurrency` the tiles reduced at once, `retries`
+    # the retries of transient tile errors and `error_budget` (e.g. 0.01 for 1%) enables adaptive
+    # scale coarsening by up to `max_scale_factor`
+    def __init__(self, max_pixels=5e7, concurrency=4, retries=2, backoff=1.0, error_budget=None,
+                 max_scale_factor=8, max_splits=3):
+        self.max_pixels = max_pixels
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.error_budget = error_budget
+        self.max_scale_factor = max_scale_factor
+        self.max_splits = max_splits
+
+    def plan(self, bounds, scale):
+        return plan_tiles(bounds, scale, self.max_pixels)
+
+    def choose_scale(self, bounds, scale, reduce_tile, call=None):
+        # Coarsest scale (doubling from `scale`) whose sums on a pilot tile in the middle of the AOI
+        # differ from the full resolution sums by at most the error budget (relative L1 error)
+        pixels = pixel_count(bounds, scale)
+        if not self.error_budget or pixels <= self.max_pixels:
+            return scale
+        left, bottom, right, top = bounds
+        fraction = math.sqrt(self.max_pixels / pixels) / 2
+        half_width, half_height = (right - left) * fraction, (top - bottom) * fraction
+        middle_x, middle_y = (left + right) / 2, (bottom + top) / 2
+        pilot = (middle_x - half_width, middle_y - half_height, middle_x + half_width, middle_y + half_height)
+
+        reference = self._reduce_once(pilot, scale, reduce_tile, call)
+        total = math.fsum(abs(value or 0) for value in reference.values())
+        chosen = scale
+        factor = 2
+        while factor <= self.max_scale_factor and total > 0:
+            coarse = self._reduce_once(pilot, scale * factor, reduce_tile, call)
+            keys = set(reference) | set(coarse)
+            error = math.fsum(abs((coarse.get(key) or 0) - (reference.get(key) or 0)) for key in keys) / total
+            if error > self.error_budget:
+                break
+            chosen = scale * factor
+            factor *= 2
+        return chosen
+
+    def reduce(self, bounds, scale, reduce_tile, call=None, progress=None):
+        # Runs `reduce_tile(tile_bounds, scale) -> {key: sum}` over the tiles of `bounds` and merges
+        # the results. `call(fn)`, when given, performs every tile's round trip (including the pilot
+        # reductions of adaptive scale) in place of the planner's own retries. `progress(fraction)` is
+        # called on the calling thread before the first and after every finished tile; when it raises
+        # (e.g. the job was cancelled) the tiles not started yet are dropped.
+        if progress is not None:
+            progress(0.0)
+        scale = self.choose_scale(bounds, scale, reduce_tile, call)
+        tiles = self.plan(bounds, scale)
+        if len(tiles) == 1:
+            sums = self._reduce_tile(tiles[0], scale, reduce_tile, call, 0)
+            if progress is not None:
+                progress(1.0)
+            return sums
+
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="tile")
+        try:
+            futures = [executor.submit(contextvars.copy_context().run, self._reduce_tile, tile, scale, reduce_tile,
+                                       call, 0)
+                       for tile in tiles]
+            parts = []
+            for future in as_completed(futures):
+                parts.append(future.result())
+                if progress is not None:
+                    progress(len(parts) / len(futures))
+            return merge_sums(parts)
+        finally:
+            # Tiles already sent finish in the background; the others are cancelled
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _reduce_once(self, tile, scale, reduce_tile, call):
+        if call is not None:
+            return call(lambda: reduce_tile(tile, scale))
+        return call_with_retries(lambda: reduce_tile(tile, scale), retries=self.retries, backoff=self.backoff,
+                                 retry_on=is_transient_error)
+
+    def _reduce_tile(self, tile, scale, reduce_tile, call, depth):
+        # Reduces one tile, quartering it when it still exceeds the server's pixel limit
+        try:
+            return self._reduce_once(tile, scale, reduce_tile, call)
+        except Exception as e:
+            if not is_pixel_limit_error(e) or depth >= self.max_splits:
+                raise
+        return merge_sums(self._reduce_tile(part, scale, reduce_tile, call, depth + 1) for part in split_tile(tile))
@@ -0,0 +1,62 @@
+# Landsat 7 NDVI time series.
+#
+# Every year is built as one feature of a server-side mapped collection, so the whole series is
+# fetched from Earth Engine with a single getInfo round trip. With a `tiling` planner (see tiling.py)
+# that is one round trip per tile, and the yearly areas of the tiles are added up.
+
+from metrics import timed_call
+
+LANDSAT7_DATASET = "LANDSAT/LE07/C02/T1_L2"
+LANDSAT7_FIRST_YEAR = 1999      # First year with Landsat 7 scenes
+
+
+def calculate_ndvi(image):
+    # Adds an NDVI band computed from NIR (SR_B4) and Red (SR_B3)
+    ndvi = image.normalizedDifference(['SR_B4', 'SR_B3']).rename('NDVI')
+    return image.addBands(ndvi)
+
+
+def ndvi_time_series(ee, bounds, start_year=2013, end_year=2023, ndvi_threshold=0.2,
+                     max_cloud_cover=20, scale=30, max_pixels=1e9, tiling=None, call=None, progress=None):
+    # Returns {year: vegetated hectares} where a pixel counts as vegetated when the median NDVI of
+    # that year's Landsat 7 scenes is above `ndvi_threshold`. `call(fn)` performs each round trip and
+    # `progress(fraction)` is called per tile.
+    series_for = lambda tile, scale: _vegetated_series(ee, tile, start_year, end_year, ndvi_threshold,
+                                                       max_cloud_cover, scale, max_pixels)
+    if tiling is None:
+        return call(lambda: series_for(bounds, scale)) if call is not None else series_for(bounds, scale)
+    series = tiling.reduce(tuple(bounds), scale, series_for, call=call, progress=progress)
+    return {year: series.get(year, 0) for year in range(start_year, end_year + 1)}
+
+
+def _vegetated_series(ee, bounds, start_year, end_year, ndvi_threshold, max_cloud_cover, scale, max_pixels):
+    rectangle = ee.Geometry.Rectangle(list(bounds))
+
+    def vegetated_area(year):
+        year = ee.Number(year)
+        landsat7 = ee.ImageCollection(LANDSAT7_DATASET) \
+            .filter(ee.Filter.date(ee.Date.fromYMD(year, 1, 1), ee.Date.fromYMD(year, 12, 31))) \
+            .filter(ee.Filter.lt('CLOUD_COVER', max_cloud_cover)) \
+            .filterBounds(rectangle)
+
+        # Take a median composite to reduce noise and classify vegetation by thresholding NDVI
+        median_ndvi = landsat7.map(calculate_ndvi).select('NDVI').median().clip(rectangle)
+        vegetation_mask = median_ndvi.gt(ndvi_threshold)
+
+        # Sum the pixel area (ha) of the vegetated pixels
+        vegetation_area = ee.Image.pixelArea().divide(10000).updateMask(vegetation_mask).reduceRegion(
+            reducer=ee.Reducer.sum(),
+            geometry=rectangle,
+            scale=scale,
+            maxPixels=max_pixels
+        )
+        return ee.Feature(None, {'year': year, 'vegetated_ha': vegetation_area.get('area')})
+
+    years = ee.List.sequence(start_year, end_year).map(vegetated_area)
+    features = timed_call("getInfo", ee.FeatureCollection(years).getInfo)["features"]
+
+    series = {}
+    for feature in features:
+        properties = feature["properties"]
+        series[int(properties["year"])] = properties.get("vegetated_ha") or 0
+    return series